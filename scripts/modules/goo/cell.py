@@ -4,10 +4,11 @@ import numpy as np
 import bpy
 import bmesh
 from bpy.types import Modifier, ClothModifier, CollisionModifier
-from mathutils import Vector
+from mathutils import Matrix, Vector
 
 from goo.force import * 
 from goo.utils import * 
+from goo.geometry import mesh_area, mesh_volume, world_coords
 
 
 class Cell(BlenderObject):
@@ -44,6 +45,11 @@ class Cell(BlenderObject):
         self._hetero_adhesions: list[AdhesionForce] = []
         self._motion_force: MotionForce = None
 
+        self._eval_cache = {}
+        self._eval_frame: int = None
+        self._mesh_generation = 0
+        self._bypassed_modifiers = False
+
     @property
     def name(self) -> str:
         """Name of the cell. Also defines the name of related forces and
@@ -58,7 +64,7 @@ class Cell(BlenderObject):
         self.obj.name = name
         self.obj.data.name = f"{name}_mesh"
         self._effectors.name = f"{name}_effectors"
-        if self._mat:
+        if self._mat and not self._shared_mat:
             self._mat.name = f"{name}_material"
 
         for force in self._hetero_adhesions:
@@ -66,10 +72,16 @@ class Cell(BlenderObject):
         if self.motion_force:
             self.motion_force.name = self.motion_force.name.replace(old_name, name, 1)
 
+    @property
+    def _shared_mat(self) -> bool:
+        """Whether the material of the cell is shared, and colored per object."""
+        return self._mat is not None and bool(self._mat.get("object_color", False))
+
     def copy(self) -> "Cell":
         """Copies the cell.
 
         The underlying Blender object, object data, and material if applicable.
+        Shared materials, colored per object, are shared with the copy instead.
 
         Warning:
             Any settings that use custom collections will not be updated. It is
@@ -86,12 +98,13 @@ class Cell(BlenderObject):
 
         if self._mat is not None:
             obj_copy.data.materials.clear()
-            mat_copy = self._mat.copy()
+            mat_copy = self._mat if self._shared_mat else self._mat.copy()
         else:
             mat_copy = None
 
         cell_copy = Cell(obj_copy, mat_copy)
         cell_copy._physics_enabled = self.physics_enabled
+        cell_copy._bypassed_modifiers = self._bypassed_modifiers
         cell_copy._update_cloth()
 
         return cell_copy
@@ -106,18 +119,136 @@ class Cell(BlenderObject):
     def __getitem__(self, k):
         return self.obj.data[k]
 
+    # ----- EVALUATION CACHE -----
+    def _cache(self) -> dict:
+        """Returns the cache of evaluated data of the current frame."""
+        frame = bpy.context.scene.frame_current
+        if self._eval_frame != frame:
+            self._eval_cache.clear()
+            self._eval_frame = frame
+        return self._eval_cache
+
+    def invalidate_cache(self):
+        """Discard cached evaluated data of the cell.
+
+        The cache is discarded automatically on frame change. This must be
+        called whenever the mesh or modifier stack of the cell are modified
+        within a frame, e.g. on division or remeshing.
+        """
+        self._eval_cache.clear()
+
+    @property
+    def mesh_generation(self) -> int:
+        """Number of times the mesh of the cell has been rebuilt, by division,
+        recentering or remeshing. Can be compared between frames to detect
+        changes of topology.
+        """
+        return self._mesh_generation
+
     # ----- BASIC FUNCTIONS -----
     @property
     def obj_eval(self) -> bpy.types.ID:
-        """The evaluated object.
+        """The evaluated object, cached for the current frame.
 
         Note:
             See the `Blender API Documentation for evaluated_get(depsgraph)
             <https://docs.blender.org/api/current/bpy.types.ID.html?highlight=evaluated_get#bpy.types.ID.evaluated_get>`__.
         """
-        dg = bpy.context.evaluated_depsgraph_get()
-        obj_eval = self.obj.evaluated_get(dg)
-        return obj_eval
+        cache = self._cache()
+        if "obj_eval" not in cache:
+            dg = bpy.context.evaluated_depsgraph_get()
+            cache["obj_eval"] = self.obj.evaluated_get(dg)
+        return cache["obj_eval"]
+
+    @property
+    def matrix_world(self) -> Matrix:
+        """The object to world matrix of the evaluated object, cached for the
+        current frame.
+        """
+        cache = self._cache()
+        if "matrix_world" not in cache:
+            cache["matrix_world"] = self.obj_eval.matrix_world.copy()
+        return cache["matrix_world"]
+
+    def _vertex_buffer(self) -> np.ndarray:
+        """Returns the (n, 3) array of local coordinates of the vertices of the
+        evaluated mesh, cached for the current frame.
+        """
+        cache = self._cache()
+        if "vertices" not in cache:
+            verts = self.obj_eval.data.vertices
+            buf = np.empty(len(verts) * 3, dtype=np.float32)
+            verts.foreach_get("co", buf)
+            buf = buf.reshape(-1, 3).astype(np.float64)
+            buf.flags.writeable = False
+            cache["vertices"] = buf
+        return cache["vertices"]
+
+    def _triangle_buffer(self) -> np.ndarray:
+        """Returns the (t, 3) array of vertex indices of the loop triangles of
+        the evaluated mesh, cached for the current frame.
+        """
+        cache = self._cache()
+        if "triangles" not in cache:
+            mesh = self.obj_eval.data
+            mesh.calc_loop_triangles()
+            buf = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+            mesh.loop_triangles.foreach_get("vertices", buf)
+            buf = buf.reshape(-1, 3)
+            buf.flags.writeable = False
+            cache["triangles"] = buf
+        return cache["triangles"]
+
+    def vertices_array(self, local_coords: bool = False) -> np.ndarray:
+        """Returns the vertices of the mesh representation of the cell as an
+        array.
+
+        Coordinates are read in bulk with `foreach_get`, and transformed to
+        world space with a single matrix multiplication. The returned array is
+        cached for the current frame and is read-only.
+
+        Args:
+            local_coords: if `True`, coordinates are returned in local object space 
+            rather than world space.
+
+        Returns:
+            An (n, 3) array of coordinates of vertices.
+        """
+        if local_coords:
+            return self._vertex_buffer()
+
+        cache = self._cache()
+        if "world_vertices" not in cache:
+            verts = world_coords(self._vertex_buffer(), self.matrix_world)
+            verts.flags.writeable = False
+            cache["world_vertices"] = verts
+        return cache["world_vertices"]
+
+    def faces_array(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the centers and areas of the faces of the mesh
+        representation of the cell.
+
+        Centers and areas are read in bulk with `foreach_get`, and cached for
+        the current frame. Centers are in world space, while areas are in
+        local object space.
+
+        Returns:
+            An (f, 3) array of face centers and an (f,) array of face areas.
+        """
+        cache = self._cache()
+        if "faces" not in cache:
+            faces = self.obj_eval.data.polygons
+            centers = np.empty(len(faces) * 3, dtype=np.float32)
+            areas = np.empty(len(faces), dtype=np.float32)
+            faces.foreach_get("center", centers)
+            faces.foreach_get("area", areas)
+
+            centers = world_coords(centers.reshape(-1, 3), self.matrix_world)
+            areas = areas.astype(np.float64)
+            centers.flags.writeable = False
+            areas.flags.writeable = False
+            cache["faces"] = (centers, areas)
+        return cache["faces"]
 
     def vertices(self, local_coords: bool = False) -> list[Vector]:
         """Returns the vertices of the mesh representation of the cell.
@@ -129,26 +260,40 @@ class Cell(BlenderObject):
         Returns:
             List of coordinates of vertices.
         """
-        verts = self.obj_eval.data.vertices
-        if local_coords:
-            return [v.co.copy() for v in verts]
-        else:
-            matrix_world = self.obj_eval.matrix_world
-            return [matrix_world @ v.co for v in verts]
+        return [Vector(co) for co in self.vertices_array(local_coords)]
 
-    def volume(self) -> float:
+    def volume(self, method: str = "divergence") -> float:
         """Calculates the volume of the cell.
 
+        Args:
+            method: "divergence" to compute the volume in closed form from the
+                loop triangles of the mesh, or "bmesh" to compute it with
+                `bmesh.calc_volume()`. The latter is much slower and is kept
+                as a reference to validate the former.
+
         Returns:
-            The signed volume of the cell (with physics evaluated).
+            The volume of the cell (with physics evaluated).
         """
-        bm = bmesh.new()
-        bm.from_mesh(self.obj_eval.to_mesh())
-        bm.transform(self.obj_eval.matrix_world)
-        volume = bm.calc_volume()
-        bm.free()
+        match method:
+            case "divergence":
+                return mesh_volume(self.vertices_array(), self._triangle_buffer())
+            case "bmesh":
+                bm = bmesh.new()
+                bm.from_mesh(self.obj_eval.to_mesh())
+                bm.transform(self.matrix_world)
+                volume = bm.calc_volume()
+                bm.free()
+                return volume
+            case _:
+                raise ValueError('method must be one of "divergence" or "bmesh".')
+
+    def area(self) -> float:
+        """Calculates the surface area of the cell.
 
-        return volume
+        Returns:
+            The surface area of the cell (with physics evaluated).
+        """
+        return mesh_area(self.vertices_array(), self._triangle_buffer())
 
     def COM(self, local_coords: bool = False) -> Vector:
         """Calculates the center of mass of a cell.
@@ -160,7 +305,7 @@ class Cell(BlenderObject):
         Returns:
             The vector representing the center of mass of the cell.
         """
-        vert_coords = self.vertices(local_coords)
+        vert_coords = self.vertices_array(local_coords)
         com = Vector(np.mean(vert_coords, axis=0))
         return com
 
@@ -180,7 +325,7 @@ class Cell(BlenderObject):
             An axis defined by the eigenvector and the vertices at the
             extreme projections along this vector.
         """
-        verts = self.vertices()
+        verts = self.vertices_array()
 
         # Calculate the eigenvectors and eigenvalues of the covariance matrix
         covariance_matrix = np.cov(verts, rowvar=False)
@@ -194,7 +339,7 @@ class Cell(BlenderObject):
         first_vertex = Vector(verts[min_index])
         last_vertex = Vector(verts[max_index])
 
-        return Axis(Vector(axis), first_vertex, last_vertex, self.obj_eval.matrix_world)
+        return Axis(Vector(axis), first_vertex, last_vertex, self.matrix_world)
 
     def major_axis(self) -> Axis:
         """Returns the major axis of the cell."""
@@ -222,6 +367,9 @@ class Cell(BlenderObject):
         # TODO: rewrite code to make it clearer that there are two daughter 
         # cells splitting from a mother cell.
         mother, daughter = division_logic.make_divide(self)
+        for cell in (mother, daughter):
+            cell.invalidate_cache()
+            cell._mesh_generation += 1
         if mother.celltype:
             mother.celltype.add_cell(daughter)
         return mother, daughter
@@ -231,13 +379,16 @@ class Cell(BlenderObject):
         bm = bmesh.new()
         bm.from_mesh(self.obj_eval.to_mesh())
 
-        com = self.COM()
-        bmesh.ops.translate(bm, verts=bm.verts, vec=-self.COM(local_coords=True))
+        local_com = self.COM(local_coords=True)
+        com = self.matrix_world @ local_com
+        bmesh.ops.translate(bm, verts=bm.verts, vec=-local_com)
 
         bm.to_mesh(self.obj.data)
         bm.free()
 
         self.loc = com
+        self.invalidate_cache()
+        self._mesh_generation += 1
 
     def remesh(self, voxel_size: float = 0.65, smooth: bool = True):
         """Remesh the underlying mesh representation of the cell.
@@ -257,26 +408,58 @@ class Cell(BlenderObject):
 
         for f in self.obj.data.polygons:
             f.use_smooth = smooth
+        if self._bypassed_modifiers:
+            self._set_pre_cloth_modifiers(True)
+            self._bypassed_modifiers = False
+        self.invalidate_cache()
+        self._mesh_generation += 1
+
+    def bypass_pre_cloth_modifiers(self):
+        """Disable the modifiers preceding the cloth modifier (e.g. the
+        subdivision of :class:`SubsurfConstructor`).
+
+        Used when the mesh of the cell is replaced by an evaluated mesh, which
+        already includes their output, e.g. when restoring checkpoints. They are
+        enabled again when the mesh is rebuilt by :func:`remesh`, e.g. on
+        division.
+        """
+        self._set_pre_cloth_modifiers(False)
+        self._bypassed_modifiers = True
+        self.invalidate_cache()
+
+    def _set_pre_cloth_modifiers(self, enabled: bool):
+        # modifiers are stored as settings while physics is disabled
+        for mod in self.obj.modifiers:
+            if mod.type == "CLOTH":
+                break
+            mod.show_viewport = mod.show_render = enabled
+        for _, type, settings in self.mod_settings:
+            if type == "CLOTH":
+                break
+            settings["show_viewport"] = settings["show_render"] = enabled
+
+    @property
+    def color(self) -> tuple[float, float, float, float]:
+        """Displayed color (r, g, b, a) of the cell."""
+        if self._mat is not None and not self._shared_mat:
+            return tuple(self._mat.diffuse_color)
+        return tuple(self.obj.color)
 
     def recolor(self, color: tuple[float, float, float]):
-        """Recolors the material of the cell.
+        """Recolors the cell.
 
-        This function changes the diffuse color of the cell's material to the
-        specified color while preserving the alpha value. If the material uses
-        nodes, it also updates the 'Base Color' input of any nodes that have it.
+        This function changes the object color of the cell, read by shared
+        materials, to the specified color while preserving the alpha value. If
+        the cell has its own material, its diffuse color and the 'Base Color'
+        input of any nodes that have it are changed as well.
 
         Args:
             color: A tuple (r, g, b) representing the new color to apply.
         """
-        r, g, b = color
-        _, _, _, a = self._mat.diffuse_color
-        self._mat.diffuse_color = (r, g, b, a)
-
-        if self._mat.use_nodes:
-            for node in self._mat.node_tree.nodes:
-                if "Base Color" in node.inputs:
-                    _, _, _, a = node.inputs["Base Color"].default_value
-                    node.inputs["Base Color"].default_value = r, g, b, a
+        r, g, b = color[:3]
+        self.obj.color = (r, g, b, self.obj.color[3])
+        if self._mat is not None and not self._shared_mat:
+            set_material_color(self._mat, color)
 
     # ----- PHYSICS -----
     def get_modifier(self, type) -> Optional[Modifier]:
@@ -326,6 +509,7 @@ class Cell(BlenderObject):
         physics_constructor(self.obj)
         self._update_cloth()
         self._physics_enabled = True
+        self.invalidate_cache()
 
     def enable_physics(self):
         """Enable the physics simulation for the cell.
@@ -353,6 +537,7 @@ class Cell(BlenderObject):
         for force in self.adhesion_forces:
             force.enable()
         self._physics_enabled = True
+        self.invalidate_cache()
 
     def disable_physics(self):
         """
@@ -378,6 +563,7 @@ class Cell(BlenderObject):
         for force in self.adhesion_forces:
             force.disable()
         self._physics_enabled = False
+        self.invalidate_cache()
 
     @property
     def stiffness(self) -> float:
@@ -456,7 +642,7 @@ class Cell(BlenderObject):
         self.add_effector(force)
         self._motion_force = force
 
-    def move_towards(self, dir: Vector):
+    def move_towards(self, dir: Vector, axis_length: float = None):
         """Sets the motion force to move the cell in a specified direction.
 
         This function sets the motion force to move the cell in the specified
@@ -465,6 +651,8 @@ class Cell(BlenderObject):
 
         Args:
             dir (Vector): The direction in which to set the motion force.
+            axis_length (float): Length of the major axis of the cell, if
+                already known. Computed from the mesh otherwise.
 
         Raises:
             RuntimeError: If the cell does not have an associated motion force.
@@ -473,7 +661,9 @@ class Cell(BlenderObject):
             raise RuntimeError(
                 f"Cell {self.name} does not have an associated motion force!"
             )
-        motion_loc = self.loc + dir.normalized() * (2 + self.major_axis().length())
+        if axis_length is None:
+            axis_length = self.major_axis().length()
+        motion_loc = self.loc + dir.normalized() * (2 + axis_length)
         self._motion_force.set_loc(motion_loc, self.loc)
 
 
@@ -578,6 +768,7 @@ class CellType:
 
         self.homo_adhesion_strength: int = 2000
         self.motion_strength: int = 0
+        self._material: bpy.types.Material = None
 
     @staticmethod
     def default_celltype() -> "CellType":
@@ -591,6 +782,15 @@ class CellType:
         """Name of the cell type."""
         return self._homo_adhesions.name
 
+    def _get_material(self, color: tuple) -> bpy.types.Material:
+        """Returns the material shared by cells of this cell type, created on
+        first use. Cells are colored by their object color."""
+        if self._material is None:
+            self._material = create_material(
+                f"{self.name}_material", color=color, object_color=True
+            )
+        return self._material
+
     def add_cell(self, cell: Cell):
         """Add a cell to the cell type, activating its physics and constructing
         appropriate forces.
@@ -678,7 +878,10 @@ class CellType:
         obj = create_mesh(name, loc, mesh="icosphere", **mesh_kwargs)
         bpy.context.scene.collection.objects.link(obj)
 
-        mat = create_material(f"{name}_material", color=color) if color else None
+        mat = None
+        if color:
+            obj.color = (*color[:3], 1)
+            mat = self._get_material(color)
         cell = Cell(obj, mat)
         cell.remesh()
 
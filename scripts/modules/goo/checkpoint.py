@@ -0,0 +1,267 @@
+"""Checkpoints of simulations, from which simulations can be resumed.
+
+A checkpoint is a single compressed ``.npz`` archive holding the evaluated
+meshes of all cells as flat arrays, and a JSON document of everything else:
+the frame and seed of the scene, the transform, custom properties, physics
+settings and forces of each cell, the state of each handler (including the
+position of exporters in their files, and contact graphs), and the state of
+the global random number generator.
+
+Checkpoints are restored into a scene built by the same script as the original
+simulation (same cell types and handlers, added in the same order). Existing
+cells are renamed and reshaped to match the saved cells, and cells created
+since (e.g. by division) are created anew. Files of data exporters are not
+rewritten by the rebuilt scene: they are truncated to the checkpoint, and
+appended to from there.
+
+Note:
+    Cloth simulations restart from the saved meshes at rest: velocities of
+    vertices are not part of the state exposed by Blender, so resumed
+    simulations closely follow, but are not bit-for-bit identical to,
+    uninterrupted ones. Saved meshes are evaluated, and so include the output
+    of modifiers preceding the cloth modifier (e.g. subdivision): these
+    modifiers are bypassed on restored cells, so that they are not applied
+    twice, until their meshes are rebuilt (e.g. remeshed on division).
+"""
+
+import json
+
+import numpy as np
+import bpy
+from mathutils import Matrix
+
+from goo.cell import Cell, CellType
+from goo.geometry import read_mesh, write_mesh
+
+
+def _to_json(value):
+    """Convert a custom property value to a JSON-serializable value."""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if hasattr(value, "to_list"):
+        return value.to_list()
+    return value
+
+
+def _write_mesh(
+    cell: Cell, verts: np.ndarray, sizes: np.ndarray, loops: np.ndarray, smooth: bool
+):
+    """Replace the mesh of a cell."""
+    write_mesh(cell.obj.data, verts, sizes, loops, smooth)
+    cell.invalidate_cache()
+    cell._mesh_generation += 1
+
+
+def _cloth_settings(cell: Cell) -> dict:
+    """Returns the cloth settings of a cell, whether its physics is enabled
+    (from the modifier) or not (from its stored modifier settings)."""
+    if cell.cloth_mod:
+        return {"pressure": cell.pressure, "stiffness": cell.stiffness}
+    for _, type, settings in cell.mod_settings:
+        if type == "CLOTH":
+            return {
+                "pressure": settings["settings"]["uniform_pressure_force"],
+                "stiffness": settings["settings"]["tension_stiffness"],
+            }
+    return {}
+
+
+def _cell_state(cell: Cell) -> dict:
+    state = {
+        "name": cell.name,
+        "celltype": cell.celltype.name if cell.celltype else None,
+        "matrix_world": [list(row) for row in cell.obj.matrix_world],
+        "color": list(cell.obj.color),
+        "physics_enabled": cell.physics_enabled,
+        "cloth": _cloth_settings(cell),
+        "props": {k: _to_json(cell[k]) for k in cell.obj.data.keys()},
+        "homo_adhesion": cell.homo_adhesion.strength if cell.homo_adhesion else None,
+        "hetero_adhesions": [force.strength for force in cell._hetero_adhesions],
+    }
+    if cell.motion_force:
+        force = cell.motion_force
+        state["motion"] = {
+            "loc": list(force.loc),
+            "rotation": list(force.obj.rotation_euler),
+            "strength": force.strength,
+            "enabled": bool(force.enabled()),
+        }
+    return state
+
+
+def save_checkpoint(sim, path: str):
+    """Save a checkpoint of a simulation at the current frame.
+
+    Args:
+        sim: The simulator.
+        path: Path of the checkpoint archive.
+    """
+    scene = bpy.context.scene
+    # handler states first, as handlers may write state to custom properties
+    handlers = [
+        {"type": type(handler).__name__, "state": handler.get_state()}
+        for handler in sim.handlers
+    ]
+
+    cells = sorted(sim.get_cells_func()(), key=lambda cell: cell.name)
+    meshes = [read_mesh(cell.obj_eval) for cell in cells]
+    cell_states = []
+    for cell, (_, _, _, smooth) in zip(cells, meshes):
+        cell_states.append(dict(_cell_state(cell), smooth=smooth))
+
+    np_random = np.random.get_state(legacy=False)
+    meta = {
+        "frame": scene.frame_current,
+        "seed": scene.get("seed", 0),
+        "cells": cell_states,
+        "handlers": handlers,
+        "np_random": {k: v for k, v in np_random.items() if k != "state"},
+        "np_random_pos": int(np_random["state"]["pos"]),
+    }
+
+    def offsets(arrays):
+        return np.concatenate(([0], np.cumsum([len(a) for a in arrays])))
+
+    verts, sizes, loops = ([mesh[k] for mesh in meshes] for k in range(3))
+    np.savez_compressed(
+        path,
+        meta=np.array(json.dumps(meta)),
+        vertices=np.concatenate(verts) if verts else np.empty((0, 3)),
+        vertex_offsets=offsets(verts),
+        polygon_sizes=np.concatenate(sizes) if sizes else np.empty(0, np.int32),
+        polygon_offsets=offsets(sizes),
+        loops=np.concatenate(loops) if loops else np.empty(0, np.int32),
+        loop_offsets=offsets(loops),
+        np_random_key=np_random["state"]["key"],
+    )
+
+
+def _match_cells(celltype: CellType, names: list[str]) -> list[Cell]:
+    """Returns cells of a cell type named as given, renaming existing cells
+    and creating new cells as needed.
+
+    Raises:
+        ValueError: If the cell type has more cells than saved.
+    """
+    existing = {cell.name: cell for cell in celltype.cells}
+    if len(existing) > len(names):
+        raise ValueError(
+            f"Cell type {celltype.name} has {len(existing)} cells, "
+            f"but {len(names)} were saved."
+        )
+    matched = {name: existing.pop(name) for name in names if name in existing}
+    unmatched = [name for name in names if name not in matched]
+
+    # rename through temporary names, to avoid clashes between cells
+    renamed = list(zip(sorted(existing.values(), key=lambda cell: cell.name), unmatched))
+    for i, (cell, _) in enumerate(renamed):
+        cell.name = f"__goo_resume_{i}"
+    for cell, name in renamed:
+        cell.name = name
+        matched[name] = cell
+
+    for name in unmatched[len(renamed):]:
+        matched[name] = celltype.create_cell(name, (0, 0, 0))
+    return [matched[name] for name in names]
+
+
+def load_checkpoint(sim, path: str) -> int:
+    """Restore a simulation from a checkpoint.
+
+    Args:
+        sim: The simulator, set up as in the original simulation.
+        path: Path of the checkpoint archive.
+
+    Returns:
+        The frame at which the checkpoint was saved.
+
+    Raises:
+        ValueError: If the checkpoint does not match the simulation.
+    """
+    scene = bpy.context.scene
+    with np.load(path) as data:
+        meta = json.loads(data["meta"].item())
+        arrays = {k: data[k] for k in data.files if k != "meta"}
+    frame = meta["frame"]
+
+    # restore cells, grouped by cell type
+    celltypes = {celltype.name: celltype for celltype in sim.celltypes}
+    by_celltype: dict[str, list[int]] = {}
+    for i, state in enumerate(meta["cells"]):
+        if state["celltype"] not in celltypes:
+            raise ValueError(f"Cell type {state['celltype']} is not in the simulation.")
+        by_celltype.setdefault(state["celltype"], []).append(i)
+
+    vo, po, lo = (
+        arrays[k] for k in ("vertex_offsets", "polygon_offsets", "loop_offsets")
+    )
+    for celltype_name, indices in by_celltype.items():
+        names = [meta["cells"][i]["name"] for i in indices]
+        cells = _match_cells(celltypes[celltype_name], names)
+        for i, cell in zip(indices, cells):
+            state = meta["cells"][i]
+            if not cell.physics_enabled and cell.mod_settings:
+                cell.enable_physics()
+
+            cell.obj.matrix_world = Matrix(state["matrix_world"])
+            cell.obj.color = state["color"]
+            _write_mesh(
+                cell,
+                arrays["vertices"][vo[i]:vo[i + 1]],
+                arrays["polygon_sizes"][po[i]:po[i + 1]],
+                arrays["loops"][lo[i]:lo[i + 1]],
+                state["smooth"],
+            )
+            cell.bypass_pre_cloth_modifiers()
+            for k in list(cell.obj.data.keys()):
+                if k not in state["props"]:
+                    del cell.obj.data[k]
+            for k, v in state["props"].items():
+                cell[k] = v
+
+            if cell.cloth_mod and state["cloth"]:
+                cell.pressure = state["cloth"]["pressure"]
+                cell.stiffness = state["cloth"]["stiffness"]
+                cell.cloth_mod.point_cache.frame_start = frame
+            if cell.homo_adhesion and state["homo_adhesion"] is not None:
+                cell.homo_adhesion.strength = state["homo_adhesion"]
+            hetero_adhesions = zip(cell._hetero_adhesions, state["hetero_adhesions"])
+            for force, strength in hetero_adhesions:
+                force.strength = strength
+            if cell.motion_force and "motion" in state:
+                motion = state["motion"]
+                cell.motion_force.loc = motion["loc"]
+                cell.motion_force.obj.rotation_euler = motion["rotation"]
+                cell.motion_force.strength = motion["strength"]
+                if motion["enabled"]:
+                    cell.motion_force.enable()
+                else:
+                    cell.motion_force.disable()
+            if cell.physics_enabled and not state["physics_enabled"]:
+                cell.disable_physics()
+
+    # set the frame without running handlers, which already ran on this frame,
+    # and evaluate the scene at it, such that cloth simulations are reset to
+    # the restored meshes and step from the next frame
+    scene["seed"] = meta["seed"]
+    scene.frame_current = frame
+    bpy.context.view_layer.update()
+    sim.invalidate_geometry()
+
+    if len(meta["handlers"]) != len(sim.handlers):
+        raise ValueError(
+            f"{len(meta['handlers'])} handlers were saved, "
+            f"but the simulation has {len(sim.handlers)}."
+        )
+    for handler, saved in zip(sim.handlers, meta["handlers"]):
+        if type(handler).__name__ != saved["type"]:
+            raise ValueError(
+                f"Handler {saved['type']} was saved in place of "
+                f"{type(handler).__name__}."
+            )
+        handler.set_state(saved["state"])
+
+    np_random = dict(meta["np_random"])
+    np_random["state"] = {"key": arrays["np_random_key"], "pos": meta["np_random_pos"]}
+    np.random.set_state(np_random)
+    return frame
@@ -0,0 +1,458 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def contact_candidates(
+    centers: np.ndarray, radii: np.ndarray, margin: float = 0
+) -> np.ndarray:
+    """Find pairs of bounding spheres that are within a margin of each other.
+
+    Pairs are found with a KD-tree in O(N log N), rather than by computing
+    all pairwise distances.
+
+    Args:
+        centers: (N, 3) array of centers of the bounding spheres.
+        radii: (N,) array of radii of the bounding spheres.
+        margin: Maximum distance between the surfaces of two spheres to
+            consider them as candidates.
+
+    Returns:
+        (P, 2) array of pairs of indices ``i < j``, in lexicographic order.
+    """
+    if len(centers) < 2:
+        return np.empty((0, 2), dtype=np.intp)
+
+    tree = cKDTree(centers)
+    pairs = tree.query_pairs(2 * np.max(radii) + margin, output_type="ndarray")
+    if not len(pairs):
+        return np.empty((0, 2), dtype=np.intp)
+
+    i, j = pairs[:, 0], pairs[:, 1]
+    dists = np.linalg.norm(centers[i] - centers[j], axis=1)
+    pairs = pairs[dists < radii[i] + radii[j] + margin]
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def contact_area(
+    centers1: np.ndarray,
+    areas1: np.ndarray,
+    centers2: np.ndarray,
+    areas2: np.ndarray,
+    threshold: float = 0.1,
+) -> tuple[float, float, float, float]:
+    """Calculate the contact areas between two meshes.
+
+    Contact is defined as two faces whose centers are within a set threshold
+    distance from each other. Faces in contact are found with KD-tree ball
+    queries, without computing all pairwise distances between faces.
+
+    Args:
+        centers1: (F1, 3) array of face centers of the first mesh.
+        areas1: (F1,) array of face areas of the first mesh.
+        centers2: (F2, 3) array of face centers of the second mesh.
+        areas2: (F2,) array of face areas of the second mesh.
+        threshold: Maximum distance between two faces of either mesh to
+            consider as contact.
+
+    Returns:
+        A tuple containing for elements:
+            - Total area of the first mesh in contact with the second
+            - Total area of the second mesh in contact with the first
+            - Ratio of area of the first mesh in contact with the second
+            - Ratio of area of the second mesh in contact with the first
+    """
+    if not len(centers1) or not len(centers2):
+        return 0.0, 0.0, 0.0, 0.0
+
+    dists1, _ = cKDTree(centers2).query(centers1, distance_upper_bound=threshold)
+    dists2, _ = cKDTree(centers1).query(centers2, distance_upper_bound=threshold)
+
+    contact_areas1 = np.sum(areas1[dists1 < threshold])
+    contact_areas2 = np.sum(areas2[dists2 < threshold])
+
+    ratio1 = contact_areas1 / np.sum(areas1)
+    ratio2 = contact_areas2 / np.sum(areas2)
+
+    return contact_areas1, contact_areas2, ratio1, ratio2
+
+
+def _pair_contact_areas(
+    centers: np.ndarray,
+    areas: np.ndarray,
+    offsets: np.ndarray,
+    pairs: np.ndarray,
+    threshold: float,
+) -> np.ndarray:
+    """Calculate contact areas of pairs of meshes, whose faces are stored
+    contiguously. Faces of the ith mesh are given by
+    ``offsets[i]:offsets[i + 1]``.
+
+    Returns:
+        (P, 4) array of contact areas and ratios. See :func:`contact_area`.
+    """
+    out = np.empty((len(pairs), 4))
+    for k, (i, j) in enumerate(pairs):
+        s1, e1 = offsets[i], offsets[i + 1]
+        s2, e2 = offsets[j], offsets[j + 1]
+        out[k] = contact_area(
+            centers[s1:e1], areas[s1:e1], centers[s2:e2], areas[s2:e2], threshold
+        )
+    return out
+
+
+def _attach(name: str, shape: tuple, dtype: str) -> tuple:
+    """Attach to a shared memory block as an array."""
+    try:
+        shm = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _shared_contact_areas(buffers: list[tuple], pairs: np.ndarray, threshold: float):
+    """Process pool worker for :func:`_pair_contact_areas`, reading faces from
+    shared memory blocks given as (name, shape, dtype).
+    """
+    blocks, arrays = zip(*(_attach(*buffer) for buffer in buffers))
+    try:
+        return _pair_contact_areas(*arrays, pairs, threshold)
+    finally:
+        del arrays
+        for shm in blocks:
+            shm.close()
+
+
+_executors: dict[tuple[str, int], Executor] = {}
+
+
+def _in_blender() -> bool:
+    """Returns whether this process is a Blender executable, as opposed to a
+    Python interpreter with the `bpy` module installed."""
+    try:
+        import bpy
+    except ImportError:
+        return False
+    return bool(bpy.app.binary_path)
+
+
+def _get_executor(executor: str, workers: int) -> Executor:
+    """Returns a pool of workers, reused across calls.
+
+    Raises:
+        ValueError: If the executor is unknown.
+        RuntimeError: If processes are requested inside Blender.
+    """
+    key = (executor, workers)
+    if key not in _executors:
+        match executor:
+            case "thread":
+                _executors[key] = ThreadPoolExecutor(workers)
+            case "process":
+                # workers run the bundled interpreter, which cannot import
+                # `bpy`, and hence `goo`, to unpickle their tasks
+                if _in_blender():
+                    raise RuntimeError(
+                        'The "process" executor cannot be used inside Blender, '
+                        'whose bundled Python cannot import bpy; use "thread".'
+                    )
+                _executors[key] = ProcessPoolExecutor(
+                    workers, mp_context=get_context("spawn")
+                )
+            case _:
+                raise ValueError('executor must be one of "thread" or "process".')
+    return _executors[key]
+
+
+def shutdown_executors(wait: bool = True):
+    """Shut down the pools of workers reused across calls, e.g. at the end of a
+    simulation. Pools are created again on demand.
+
+    Args:
+        wait: Whether to wait for pending work and for workers to exit.
+    """
+    for pool in _executors.values():
+        pool.shutdown(wait=wait)
+    _executors.clear()
+
+
+def parallel_contact_areas(
+    centers: np.ndarray,
+    areas: np.ndarray,
+    offsets: np.ndarray,
+    pairs: np.ndarray,
+    threshold: float = 0.1,
+    workers: int = 4,
+    executor: str = "thread",
+) -> np.ndarray:
+    """Calculate contact areas of pairs of meshes across a pool of workers.
+
+    The faces of all meshes are stored contiguously, such that the faces of
+    the ith mesh are given by ``offsets[i]:offsets[i + 1]``. Pairs are split
+    into batches, which are dispatched to the pool. Threads share the face
+    arrays directly; processes read them from shared memory.
+
+    Note:
+        This function does not use `bpy`, which is not thread-safe: face
+        arrays must be extracted on the main thread beforehand. The "process"
+        executor spawns new interpreters, which must be able to import
+        `goo`: it requires the `bpy` module installed, and cannot be used
+        inside Blender.
+
+    Args:
+        centers: (F, 3) array of face centers of all meshes.
+        areas: (F,) array of face areas of all meshes.
+        offsets: (N + 1,) array of face offsets of each mesh.
+        pairs: (P, 2) array of pairs of mesh indices.
+        threshold: Maximum distance between two faces to consider as contact.
+        workers: Number of workers of the pool.
+        executor: "thread" or "process".
+
+    Raises:
+        RuntimeError: If the "process" executor is used inside Blender.
+
+    Returns:
+        (P, 4) array of contact areas and ratios. See :func:`contact_area`.
+    """
+    if not len(pairs):
+        return np.empty((0, 4))
+    batches = np.array_split(pairs, min(len(pairs), 4 * workers))
+    pool = _get_executor(executor, workers)
+
+    if executor == "thread":
+        futures = [
+            pool.submit(_pair_contact_areas, centers, areas, offsets, batch, threshold)
+            for batch in batches
+        ]
+        return np.concatenate([future.result() for future in futures])
+
+    blocks, buffers = [], []
+    try:
+        for array in (centers, areas, offsets):
+            array = np.ascontiguousarray(array)
+            shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            buffers.append((shm.name, array.shape, array.dtype.str))
+
+        futures = [
+            pool.submit(_shared_contact_areas, buffers, batch, threshold)
+            for batch in batches
+        ]
+        return np.concatenate([future.result() for future in futures])
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+class ContactGraph:
+    """A graph of contacts between cells, maintained across frames.
+
+    Cell neighborhoods change slowly from frame to frame. On each update,
+    candidate pairs are screened by bounding spheres, and only pairs involving
+    a cell whose center of mass or bounding sphere radius has changed by more
+    than a tolerance since it was last tested, or pairs that were not
+    candidates before, are tested again. Cells that have just divided (i.e.
+    with the `divided` property set) are always tested again, along with the
+    pairs of their mother cell.
+
+    Args:
+        tolerance: Change in center of mass or bounding sphere radius above
+            which the contacts of a cell are tested again. If 0, all pairs are
+            tested every update.
+        threshold: Maximum distance between two faces of either cell to
+            consider as contact.
+        workers: If greater than 1, the number of workers across which pairs
+            are tested. See :func:`parallel_contact_areas`.
+        executor: Pool of workers to use, either "thread" or "process". See
+            :func:`parallel_contact_areas`.
+    """
+
+    def __init__(
+        self,
+        tolerance: float = 0.05,
+        threshold: float = 0.1,
+        workers: int = None,
+        executor: str = "thread",
+    ):
+        self.tolerance = tolerance
+        self.threshold = threshold
+        self.workers = workers
+        self.executor = executor
+
+        self._tested = {}  # cell name -> (center of mass, radius) when tested
+        self._contacts = {}  # sorted pair of cell names -> contact areas and ratios
+        self._geometry = None
+
+    def invalidate(self, name: str = None):
+        """Discard the contacts of a cell, or of all cells if `name` is None."""
+        if name is None:
+            self._tested.clear()
+            self._contacts.clear()
+            return
+        self._tested.pop(name, None)
+        for pair in [pair for pair in self._contacts if name in pair]:
+            del self._contacts[pair]
+
+    def update(self, cells: list, geometry) -> tuple[dict, dict]:
+        """Update the contacts between cells.
+
+        Args:
+            cells: The list of cells to calculate contact areas over.
+            geometry: Snapshot of the cells from which centers of mass and
+                bounding spheres are read (see :class:`goo.geometry.CellGeometry`).
+                Updating twice with the same snapshot is a no-op.
+
+        Returns:
+            The pairwise contact areas and contact ratios, keyed by cell name,
+            as returned by :func:`goo.handler._contact_areas`.
+        """
+        if geometry is not self._geometry:
+            self._update(cells, geometry)
+            self._geometry = geometry
+        return self.areas(cells)
+
+    def _update(self, cells: list, geometry):
+        names = [cell.name for cell in cells]
+        indices = np.array([geometry.index(cell) for cell in cells], dtype=np.intp)
+        coms = geometry.coms[indices]
+        radii = geometry.radii[indices]
+
+        # forget cells that no longer exist or have just divided
+        for name in set(self._tested) - set(names):
+            self.invalidate(name)
+        for cell in cells:
+            if "divided" in cell and cell["divided"]:
+                self.invalidate(cell.name)
+                self.invalidate(cell.name[:-2])
+
+        moved = np.ones(len(cells), dtype=bool)
+        for k, name in enumerate(names):
+            if name in self._tested:
+                com, radius = self._tested[name]
+                moved[k] = (
+                    np.linalg.norm(coms[k] - com) > self.tolerance
+                    or abs(radii[k] - radius) > self.tolerance
+                    or self.tolerance == 0
+                )
+
+        candidates = contact_candidates(coms, radii, self.threshold)
+        keys = [tuple(sorted((names[i], names[j]))) for i, j in candidates]
+        retest = [
+            k
+            for k, (i, j) in enumerate(candidates)
+            if moved[i] or moved[j] or keys[k] not in self._contacts
+        ]
+
+        # test pairs on the faces of involved cells only
+        involved = np.unique(candidates[retest]) if retest else np.empty(0, np.intp)
+        local = {i: k for k, i in enumerate(involved)}
+        faces = [cells[i].faces_array() for i in involved]
+        offsets = np.concatenate(([0], np.cumsum([len(a) for _, a in faces])))
+        centers = np.concatenate([c for c, _ in faces]) if faces else np.empty((0, 3))
+        areas = np.concatenate([a for _, a in faces]) if faces else np.empty(0)
+        pairs = np.array(
+            [(local[candidates[k][0]], local[candidates[k][1]]) for k in retest],
+            dtype=np.intp,
+        ).reshape(-1, 2)
+        if self.workers is not None and self.workers > 1:
+            results = parallel_contact_areas(
+                centers,
+                areas,
+                offsets,
+                pairs,
+                self.threshold,
+                self.workers,
+                self.executor,
+            )
+        else:
+            results = _pair_contact_areas(centers, areas, offsets, pairs, self.threshold)
+
+        results = dict(zip(retest, results))
+        contacts = {}
+        for k, key in enumerate(keys):
+            if k not in results:
+                contacts[key] = self._contacts[key]
+                continue
+            i, j = candidates[k]
+            area_i, area_j, ratio_i, ratio_j = results[k]
+            if names[i] > names[j]:
+                area_i, area_j, ratio_i, ratio_j = area_j, area_i, ratio_j, ratio_i
+            contacts[key] = (area_i, area_j, ratio_i, ratio_j)
+        self._contacts = contacts
+
+        for k, name in enumerate(names):
+            if moved[k]:
+                self._tested[name] = (coms[k].copy(), radii[k])
+
+    def get_state(self) -> dict:
+        """Returns the state of the graph, to be saved in checkpoints."""
+        return {
+            "tested": {
+                name: [com.tolist(), float(radius)]
+                for name, (com, radius) in self._tested.items()
+            },
+            "contacts": [
+                [name1, name2, *map(float, contact)]
+                for (name1, name2), contact in self._contacts.items()
+            ],
+        }
+
+    def set_state(self, state: dict):
+        """Restore the state of the graph from a checkpoint."""
+        self._tested = {
+            name: (np.array(com), radius)
+            for name, (com, radius) in state["tested"].items()
+        }
+        self._contacts = {
+            (name1, name2): tuple(contact)
+            for name1, name2, *contact in state["contacts"]
+        }
+        self._geometry = None
+
+    def areas(self, cells: list) -> tuple[dict, dict]:
+        """Returns the pairwise contact areas and contact ratios between cells,
+        as of the last update.
+        """
+        areas = {cell.name: [] for cell in cells}
+        ratios = {cell.name: [] for cell in cells}
+        for (name1, name2), (area1, area2, ratio1, ratio2) in self._contacts.items():
+            if name1 not in areas or name2 not in areas:
+                continue
+            areas[name1].append((name2, area1))
+            areas[name2].append((name1, area2))
+            ratios[name1].append((name2, ratio1))
+            ratios[name2].append((name1, ratio2))
+        return areas, ratios
+
+    def neighbors(self, name: str) -> list[str]:
+        """Returns the names of the cells in contact with a cell."""
+        return [
+            other
+            for pair, (area1, area2, _, _) in self._contacts.items()
+            if name in pair and (area1 > 0 or area2 > 0)
+            for other in pair
+            if other != name
+        ]
+
+    def contact(self, name1: str, name2: str) -> tuple[float, float, float, float]:
+        """Returns the contact areas and ratios between two cells, as of the
+        last update, or None if they were not candidates for contact.
+
+        See :func:`contact_area`.
+        """
+        if name1 > name2:
+            result = self.contact(name2, name1)
+            return result and (result[1], result[0], result[3], result[2])
+        return self._contacts.get((name1, name2))
+
+    def edges(self) -> list[tuple[str, str]]:
+        """Returns the pairs of names of cells that are in contact."""
+        return [
+            pair
+            for pair, (area1, area2, _, _) in self._contacts.items()
+            if area1 > 0 or area2 > 0
+        ]
@@ -230,6 +230,18 @@ class DivisionHandler(Handler):
         """
         raise NotImplementedError("Subclasses must implement can_divide() method.")
 
+    @override
+    def get_state(self):
+        state = super(DivisionHandler, self).get_state()
+        state["cells_to_update"] = [cell.name for cell in self._cells_to_update]
+        return state
+
+    @override
+    def set_state(self, state):
+        super(DivisionHandler, self).set_state(state)
+        cells = {cell.name: cell for cell in self.get_cells()}
+        self._cells_to_update = [cells[name] for name in state["cells_to_update"]]
+
     def update_on_divide(self, cell: Cell):
         """Perform updates after a cell has divided.
 
@@ -243,17 +255,22 @@ class DivisionHandler(Handler):
 
     @override
     def run(self, scene, depsgraph):
-        for cell in self._cells_to_update:
-            cell.enable_physics()
-            cell.cloth_mod.point_cache.frame_start = scene.frame_current
-            cell["divided"] = False
-        self._cells_to_update.clear()
-
-        for cell in self.get_cells():
+        if self._cells_to_update:
+            for cell in self._cells_to_update:
+                cell.enable_physics()
+                cell.cloth_mod.point_cache.frame_start = scene.frame_current
+                cell["divided"] = False
+            self._cells_to_update.clear()
+            self.geometry.invalidate()
+
+        divided = False
+        cells = self.get_cells()
+        for cell in cells:
             if self.can_divide(cell):
                 mother, daughter = cell.divide(self.division_logic)
                 self.update_on_divide(mother)
                 self.update_on_divide(daughter)
+                divided = True
 
                 if mother.physics_enabled:
                     self._cells_to_update.extend([mother, daughter])
@@ -262,6 +279,9 @@ class DivisionHandler(Handler):
             cell.disable_physics()
             cell["divided"] = True
         self.division_logic.flush()
+        if divided:
+            self.geometry.invalidate()
+        self.processed = len(cells)
 
 
 class TimeDivisionHandler(DivisionHandler):
@@ -290,7 +310,7 @@ class TimeDivisionHandler(DivisionHandler):
             cell["last_division_time"] = time
             return False
         # implement variance too
-        div_time = int(np.random.normal(self.mu, self.sigma))
+        div_time = int(self.cell_rng(cell).normal(self.mu, self.sigma))
         return time - cell["last_division_time"] >= div_time
 
     @override
@@ -313,5 +333,5 @@ class SizeDivisionHandler(DivisionHandler):
 
     @override
     def can_divide(self, cell: Cell):
-        div_volume = np.random.normal(self.mu, self.sigma)
-        return cell.volume() >= div_volume
+        div_volume = self.cell_rng(cell).normal(self.mu, self.sigma)
+        return self.geometry.get().volume(cell) >= div_volume
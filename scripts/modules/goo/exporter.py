@@ -0,0 +1,601 @@
+from enum import Enum
+import glob
+import json
+import os
+import struct
+
+import numpy as np
+
+
+"""Possible file formats of exported data."""
+ExportFormat = Enum("ExportFormat", ["JSON", "JSONL", "BINARY", "NPZ", "HDF5"])
+
+_MAGIC = b"GOO1"
+_HEADER = struct.Struct("<I")
+_COLUMNS = {"loc": 3, "motion_loc": 3, "volume": 1, "pressure": 1}
+
+
+class DataWriter:
+    """Base class for writers of data exported during the simulation.
+
+    A writer receives one record per frame, as built by
+    :class:`goo.handler.DataExporter`, and is closed at the end of the
+    simulation.
+
+    Writers can be resumed from a checkpoint: given the state returned by
+    :func:`get_state`, records written after it was taken are discarded, and
+    subsequent records are appended.
+
+    Args:
+        path: Path of the file to write.
+        seed: Random seed of the simulation.
+        state: State from which to resume writing, if any.
+    """
+
+    def __init__(self, path: str, seed: int, state: dict = None):
+        self.path = path
+        self.seed = seed
+
+    def write(self, frame_out: dict):
+        """Write the record of a frame.
+
+        Args:
+            frame_out: The record of the frame.
+        """
+        raise NotImplementedError("Subclasses must implement write() method.")
+
+    def close(self):
+        """Flush and close the underlying file."""
+        pass
+
+    def get_state(self) -> dict:
+        """Flush written records to disk, and returns the state of the writer
+        to be saved in checkpoints. The state must be serializable to JSON."""
+        return {}
+
+
+class JSONWriter(DataWriter):
+    """Writer of a single JSON document, which is read and rewritten in
+    full every frame.
+    """
+
+    def __init__(self, path, seed, state=None):
+        super(JSONWriter, self).__init__(path, seed, state)
+        if state is None:
+            self._count = 0
+            out = {"seed": seed, "frames": []}
+        else:
+            self._count = state["frames"]
+            with open(self.path, "r") as f:
+                out = json.load(f)
+            del out["frames"][self._count:]
+        with open(self.path, "w") as f:
+            f.write(json.dumps(out))
+
+    def write(self, frame_out):
+        with open(self.path, "r") as f:
+            out = json.load(f)
+            out["frames"].append(frame_out)
+        with open(self.path, "w") as f:
+            f.write(json.dumps(out))
+        self._count += 1
+
+    def get_state(self):
+        return {"frames": self._count}
+
+
+class _StreamWriter(DataWriter):
+    """Writer that appends records to a file kept open across frames. If the
+    writer is closed, it is reopened for appending on the next record.
+
+    Args:
+        path: Path of the file to write.
+        seed: Random seed of the simulation.
+        flush_freq: Number of frames between flushes to disk.
+        state: State from which to resume writing, if any.
+    """
+
+    mode = "w"
+
+    def __init__(self, path, seed, flush_freq=10, state=None):
+        super(_StreamWriter, self).__init__(path, seed, state)
+        self.flush_freq = flush_freq
+        self._count = 0
+        if state is None:
+            self._f = open(self.path, self.mode)
+            self._write_header()
+        else:
+            os.truncate(self.path, state["offset"])
+            self._f = open(self.path, self.mode.replace("w", "a"))
+
+    def _write_header(self):
+        pass
+
+    def _write_record(self, frame_out: dict):
+        raise NotImplementedError()
+
+    def write(self, frame_out):
+        if self._f.closed:
+            self._f = open(self.path, self.mode.replace("w", "a"))
+        self._write_record(frame_out)
+        self._count += 1
+        if self._count % self.flush_freq == 0:
+            self._f.flush()
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def get_state(self):
+        if self._f.closed:
+            return {"offset": os.path.getsize(self.path)}
+        self._f.flush()
+        return {"offset": self._f.tell()}
+
+
+class JSONLinesWriter(_StreamWriter):
+    """Writer of JSON Lines, with the seed on the first line and one frame
+    per subsequent line.
+    """
+
+    def _write_header(self):
+        self._f.write(json.dumps({"seed": self.seed}) + "\n")
+
+    def _write_record(self, frame_out):
+        self._f.write(json.dumps(frame_out) + "\n")
+
+
+class BinaryWriter(_StreamWriter):
+    """Writer of a compact, columnar binary format.
+
+    The file starts with a magic number and is followed by records. Each
+    record consists of a length-prefixed JSON header, followed by the raw
+    little-endian bytes of the columns listed in the header. Per-cell
+    quantities (locations, motion force locations, volumes and pressures)
+    are stored as float64 columns, with NaN for missing values; all other
+    fields are stored in the header.
+    """
+
+    mode = "wb"
+
+    def _write_header(self):
+        self._f.write(_MAGIC)
+        self._write_block({"seed": self.seed}, [])
+
+    def _write_block(self, header: dict, columns: list[np.ndarray]):
+        data = json.dumps(header).encode()
+        self._f.write(_HEADER.pack(len(data)))
+        self._f.write(data)
+        for column in columns:
+            self._f.write(column.astype("<f8").tobytes())
+
+    def _write_record(self, frame_out):
+        cells = frame_out.get("cells", [])
+        header = {k: v for k, v in frame_out.items() if k != "cells"}
+        header["names"] = [cell["name"] for cell in cells]
+        header["columns"] = []
+
+        columns = []
+        for name, width in _COLUMNS.items():
+            if not any(name in cell for cell in cells):
+                continue
+            column = np.full((len(cells), width), np.nan)
+            for i, cell in enumerate(cells):
+                if name in cell:
+                    column[i] = cell[name]
+            header["columns"].append(name)
+            columns.append(column)
+        self._write_block(header, columns)
+
+
+class _ColumnBuilder:
+    """Converts frame records into columnar arrays.
+
+    Cells are identified by integer ids, assigned in order of first
+    appearance, and stored in a names table. Per-cell quantities of all frames
+    are stored in flat arrays, with the number of cells of each frame stored
+    in `count`. Missing values are NaN.
+    """
+
+    def __init__(self):
+        self.names = []
+        self._ids = {}
+        self.lineage = []
+
+    def id(self, name: str) -> int:
+        """Returns the id of a cell name, assigning a new one if needed."""
+        if name not in self._ids:
+            self._ids[name] = len(self.names)
+            self.names.append(name)
+        return self._ids[name]
+
+    def convert(self, frame_out: dict) -> dict[str, np.ndarray]:
+        """Convert the record of a frame to arrays, keyed by field."""
+        frame = frame_out["frame"]
+        cells = frame_out.get("cells", [])
+        n = len(cells)
+
+        columns = {
+            "frame": np.array([frame], dtype=np.int32),
+            "time": np.array([frame_out.get("time", np.nan)], dtype=np.float64),
+            "count": np.array([n], dtype=np.int32),
+            "cell_id": np.array([self.id(c["name"]) for c in cells], dtype=np.int32),
+        }
+        for name, width in _COLUMNS.items():
+            column = np.full((n, width), np.nan)
+            for i, cell in enumerate(cells):
+                if name in cell:
+                    column[i] = cell[name]
+            columns[name] = column if width > 1 else column[:, 0]
+
+        pairs, areas, ratios = [], [], []
+        contact_areas = frame_out.get("contact_areas", {})
+        contact_ratios = frame_out.get("contact_ratios", {})
+        for name, contacts in contact_areas.items():
+            for (other, area), (_, ratio) in zip(contacts, contact_ratios[name]):
+                pairs.append((self.id(name), self.id(other)))
+                areas.append(area)
+                ratios.append(ratio)
+        columns["contact_count"] = np.array([len(pairs)], dtype=np.int32)
+        columns["contact_cells"] = np.array(pairs, dtype=np.int32).reshape(-1, 2)
+        columns["contact_area"] = np.array(areas, dtype=np.float64)
+        columns["contact_ratio"] = np.array(ratios, dtype=np.float64)
+
+        for mother, daughter0, daughter1 in frame_out.get("divisions", []):
+            self.lineage.append(
+                (frame, self.id(mother), self.id(daughter0), self.id(daughter1))
+            )
+        return columns
+
+    def lineage_array(self) -> np.ndarray:
+        """(L, 4) array of divisions, as rows of frame, mother id and
+        daughter ids."""
+        return np.array(self.lineage, dtype=np.int32).reshape(-1, 4)
+
+    def get_state(self) -> dict:
+        """Returns the names and lineage tables."""
+        return {"names": list(self.names), "lineage": [list(row) for row in self.lineage]}
+
+    def set_state(self, state: dict):
+        """Restore the names and lineage tables."""
+        self.names = list(state["names"])
+        self._ids = {name: i for i, name in enumerate(self.names)}
+        self.lineage = [tuple(row) for row in state["lineage"]]
+
+
+class NPZWriter(DataWriter):
+    """Writer of compressed NumPy archives in a directory.
+
+    Frames are buffered, and every `flush_freq` frames written as a chunk
+    ``chunk_XXXXX.npz`` of columnar arrays. Each chunk also holds the names
+    and lineage tables up to that frame. See :func:`load_columns`.
+
+    Args:
+        path: Path of the directory to write.
+        seed: Random seed of the simulation.
+        flush_freq: Number of frames per chunk.
+        state: State from which to resume writing, if any.
+    """
+
+    def __init__(self, path, seed, flush_freq=10, state=None):
+        super(NPZWriter, self).__init__(path, seed, state)
+        self.flush_freq = flush_freq
+        self._builder = _ColumnBuilder()
+        self._buffer = []
+        self._n_chunks = 0
+        if state is not None:
+            self._builder.set_state(state)
+            self._n_chunks = state["chunks"]
+
+        os.makedirs(self.path, exist_ok=True)
+        for chunk in glob.glob(os.path.join(self.path, "chunk_*.npz")):
+            index = int(os.path.basename(chunk)[len("chunk_"):-len(".npz")])
+            if index >= self._n_chunks:
+                os.remove(chunk)
+
+    def write(self, frame_out):
+        self._buffer.append(self._builder.convert(frame_out))
+        if len(self._buffer) >= self.flush_freq:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        chunk = {
+            k: np.concatenate([columns[k] for columns in self._buffer])
+            for k in self._buffer[0]
+        }
+        np.savez_compressed(
+            os.path.join(self.path, f"chunk_{self._n_chunks:05d}.npz"),
+            seed=np.array(self.seed),
+            names=np.array(self._builder.names, dtype=str),
+            lineage=self._builder.lineage_array(),
+            **chunk,
+        )
+        self._n_chunks += 1
+        self._buffer.clear()
+
+    def close(self):
+        self._flush()
+
+    def get_state(self):
+        # buffered frames are written as a (possibly short) chunk
+        self._flush()
+        return dict(self._builder.get_state(), chunks=self._n_chunks)
+
+
+class HDF5Writer(DataWriter):
+    """Writer of an HDF5 file of chunked, compressed, resizable datasets, which
+    are appended to every frame. If the writer is closed, the file is reopened
+    for appending on the next record. Requires `h5py`. See :func:`load_columns`.
+
+    Args:
+        path: Path of the file to write.
+        seed: Random seed of the simulation.
+        flush_freq: Number of frames between flushes to disk.
+        chunk_size: Number of rows per chunk of each dataset.
+        state: State from which to resume writing, if any.
+    """
+
+    def __init__(self, path, seed, flush_freq=10, chunk_size=4096, state=None):
+        super(HDF5Writer, self).__init__(path, seed, state)
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("The HDF5 export format requires h5py to be installed.")
+        self._h5py = h5py
+        self.flush_freq = flush_freq
+        self.chunk_size = chunk_size
+        self._builder = _ColumnBuilder()
+        self._count = 0
+
+        if state is not None:
+            self._builder.set_state(state)
+            self._f = h5py.File(self.path, "a")
+            for name in list(self._f.keys()):
+                if name in state["lengths"]:
+                    self._f[name].resize(state["lengths"][name], axis=0)
+                else:
+                    del self._f[name]
+            return
+
+        self._f = h5py.File(self.path, "w")
+        self._f.attrs["seed"] = seed
+        self._f.create_dataset(
+            "names",
+            shape=(0,),
+            maxshape=(None,),
+            chunks=(chunk_size,),
+            dtype=h5py.string_dtype(),
+        )
+
+    def _append(self, name: str, values: np.ndarray):
+        if name not in self._f:
+            self._f.create_dataset(
+                name,
+                shape=(0,) + values.shape[1:],
+                maxshape=(None,) + values.shape[1:],
+                chunks=(self.chunk_size,) + values.shape[1:],
+                dtype=values.dtype,
+                compression="gzip",
+            )
+        dataset = self._f[name]
+        if len(values):
+            dataset.resize(len(dataset) + len(values), axis=0)
+            dataset[-len(values):] = values
+
+    def write(self, frame_out):
+        # h5py files are falsy once closed
+        if not self._f:
+            self._f = self._h5py.File(self.path, "a")
+        n_lineage = len(self._builder.lineage)
+        for name, values in self._builder.convert(frame_out).items():
+            self._append(name, values)
+        self._append("lineage", self._builder.lineage_array()[n_lineage:])
+
+        names = self._f["names"]
+        new_names = self._builder.names[len(names):]
+        if new_names:
+            names.resize(len(names) + len(new_names), axis=0)
+            names[-len(new_names):] = new_names
+
+        self._count += 1
+        if self._count % self.flush_freq == 0:
+            self._f.flush()
+
+    def close(self):
+        if self._f:
+            self._f.close()
+
+    def get_state(self):
+        if not self._f:
+            with self._h5py.File(self.path, "r") as f:
+                lengths = {name: len(dataset) for name, dataset in f.items()}
+        else:
+            self._f.flush()
+            lengths = {name: len(dataset) for name, dataset in self._f.items()}
+        return dict(self._builder.get_state(), lengths=lengths)
+
+
+def load_columns(path: str) -> dict[str, np.ndarray]:
+    """Load columnar data exported by :class:`goo.handler.DataExporter` in the
+    `NPZ` or `HDF5` formats.
+
+    Per-cell fields ("cell_id", "loc", "motion_loc", "volume", "pressure")
+    are flat over all frames; the rows of frame ``i`` are given by
+    ``frame_offsets[i]:frame_offsets[i + 1]``. Similarly, contact fields
+    ("contact_cells", "contact_area", "contact_ratio") are indexed by
+    "contact_offsets". Cell ids index into "names", and "lineage" holds rows
+    of frame, mother id and daughter ids.
+
+    Args:
+        path: Path of the exported directory (`NPZ`) or file (`HDF5`).
+
+    Returns:
+        A dictionary of arrays, keyed by field.
+    """
+    if os.path.isdir(path):
+        chunks = [
+            np.load(chunk)
+            for chunk in sorted(glob.glob(os.path.join(path, "chunk_*.npz")))
+        ]
+        if not chunks:
+            raise FileNotFoundError(f"No exported chunks found in {path}.")
+        tables = ("seed", "names", "lineage")
+        out = {k: chunks[-1][k] for k in tables}
+        for k in chunks[0].files:
+            if k not in tables:
+                out[k] = np.concatenate([chunk[k] for chunk in chunks])
+        out["seed"] = out["seed"].item()
+    else:
+        import h5py
+
+        with h5py.File(path, "r") as f:
+            out = {k: f[k][()] for k in f.keys() if k != "names"}
+            out["names"] = np.array(f["names"].asstr()[()], dtype=str)
+            out["seed"] = f.attrs["seed"].item()
+
+    out["frame_offsets"] = np.concatenate(([0], np.cumsum(out.pop("count"))))
+    out["contact_offsets"] = np.concatenate(
+        ([0], np.cumsum(out.pop("contact_count")))
+    )
+    return out
+
+
+def _read_binary(path: str) -> dict:
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not a Goo binary export.")
+        buf = f.read()
+
+    out, pos = None, 0
+    while pos + _HEADER.size <= len(buf):
+        (size,) = _HEADER.unpack_from(buf, pos)
+        pos += _HEADER.size
+        if pos + size > len(buf):
+            break  # truncated record
+        header = json.loads(buf[pos:pos + size])
+        pos += size
+
+        if out is None:
+            out = {"seed": header["seed"], "frames": []}
+            continue
+
+        names = header.pop("names")
+        column_names = header.pop("columns")
+        n = len(names)
+        columns = {}
+        for name in column_names:
+            nbytes = n * _COLUMNS[name] * 8
+            if pos + nbytes > len(buf):
+                return out  # truncated record
+            column = np.frombuffer(buf, dtype="<f8", count=nbytes // 8, offset=pos)
+            columns[name] = column.reshape(n, _COLUMNS[name])
+            pos += nbytes
+
+        cells = []
+        for i, name in enumerate(names):
+            cell_out = {"name": name}
+            for column_name, column in columns.items():
+                if np.all(np.isnan(column[i])):
+                    continue
+                if _COLUMNS[column_name] == 1:
+                    cell_out[column_name] = float(column[i, 0])
+                else:
+                    cell_out[column_name] = column[i].tolist()
+            cells.append(cell_out)
+
+        frame_out = {
+            k: header.pop(k) for k in ("frame", "time", "divisions") if k in header
+        }
+        frame_out["cells"] = cells
+        frame_out.update(header)
+        out["frames"].append(frame_out)
+    return out
+
+
+def _read_jsonl(path: str) -> dict:
+    out = None
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                break  # truncated record
+            if out is None:
+                out = {"seed": record["seed"], "frames": []}
+            else:
+                out["frames"].append(record)
+    return out
+
+
+def load_data(path: str, file_format: ExportFormat = None) -> dict:
+    """Load data exported by :class:`goo.handler.DataExporter`.
+
+    Args:
+        path: Path of the exported file.
+        file_format: Format of the exported file. If None, it is inferred
+            from the file extension (".jsonl", ".bin" or ".json").
+
+    Returns:
+        A dictionary with keys "seed" and "frames", as written by the
+        :attr:`ExportFormat.JSON` format.
+    """
+    if file_format is None:
+        if path.endswith(".jsonl"):
+            file_format = ExportFormat.JSONL
+        elif path.endswith(".bin"):
+            file_format = ExportFormat.BINARY
+        else:
+            file_format = ExportFormat.JSON
+
+    match file_format:
+        case ExportFormat.JSON:
+            with open(path, "r") as f:
+                return json.load(f)
+        case ExportFormat.JSONL:
+            return _read_jsonl(path)
+        case ExportFormat.BINARY:
+            return _read_binary(path)
+        case ExportFormat.NPZ | ExportFormat.HDF5:
+            raise ValueError("Columnar formats must be loaded with load_columns().")
+        case _:
+            raise ValueError("File format must be one of JSON, JSONL, or BINARY.")
+
+
+def create_writer(
+    path: str,
+    seed: int,
+    file_format: ExportFormat,
+    flush_freq: int = 10,
+    state: dict = None,
+) -> DataWriter:
+    """Creates a writer of exported data.
+
+    Args:
+        path: Path of the file to write.
+        seed: Random seed of the simulation.
+        file_format: Format of the file.
+        flush_freq: Number of frames between flushes to disk, for streaming
+            formats.
+        state: State of a writer, as returned by :func:`DataWriter.get_state`,
+            from which to resume writing an existing file.
+
+    Returns:
+        The writer.
+    """
+    match file_format:
+        case ExportFormat.JSON:
+            return JSONWriter(path, seed, state=state)
+        case ExportFormat.JSONL:
+            return JSONLinesWriter(path, seed, flush_freq, state=state)
+        case ExportFormat.BINARY:
+            return BinaryWriter(path, seed, flush_freq, state=state)
+        case ExportFormat.NPZ:
+            return NPZWriter(path, seed, flush_freq, state=state)
+        case ExportFormat.HDF5:
+            return HDF5Writer(path, seed, flush_freq, state=state)
+        case _:
+            raise ValueError(
+                "File format must be one of JSON, JSONL, BINARY, NPZ, or HDF5."
+            )
@@ -0,0 +1,373 @@
+from functools import cached_property
+from typing import Callable, Optional
+
+import numpy as np
+import bpy
+from mathutils import Matrix, Vector
+
+from goo.utils import Axis
+
+
+def world_coords(local: np.ndarray, matrix_world: Matrix) -> np.ndarray:
+    """Transform an (n, 3) array of local coordinates to world space."""
+    mat = np.array(matrix_world)
+    return local @ mat[:3, :3].T + mat[:3, 3]
+
+
+def _segment_sum(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Sum contiguous segments of an array, given as offsets into its first axis.
+
+    Args:
+        values: Array of values to sum.
+        offsets: (n + 1,) array of segment boundaries.
+
+    Returns:
+        An array of n sums. Empty segments sum to zero.
+    """
+    n = len(offsets) - 1
+    out = np.zeros((n,) + values.shape[1:], dtype=np.float64)
+    nonempty = offsets[:-1] < offsets[1:]
+    if np.any(nonempty):
+        out[nonempty] = np.add.reduceat(values, offsets[:-1][nonempty], axis=0)
+    return out
+
+
+def triangle_volumes(coords: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Signed volumes of the tetrahedra formed by each triangle and the origin.
+
+    By the divergence theorem, their sum over a closed, consistently oriented
+    mesh is the volume enclosed by the mesh.
+
+    Args:
+        coords: (V, 3) array of vertex coordinates.
+        triangles: (T, 3) array of triangles, as indices into `coords`.
+
+    Returns:
+        (T,) array of signed volumes.
+    """
+    v0, v1, v2 = (coords[triangles[:, k]] for k in range(3))
+    return np.einsum("ij,ij->i", v0, np.cross(v1, v2)) / 6
+
+
+def triangle_areas(coords: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Areas of each triangle of a mesh.
+
+    Args:
+        coords: (V, 3) array of vertex coordinates.
+        triangles: (T, 3) array of triangles, as indices into `coords`.
+
+    Returns:
+        (T,) array of areas.
+    """
+    v0, v1, v2 = (coords[triangles[:, k]] for k in range(3))
+    return np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1) / 2
+
+
+def mesh_volume(coords: np.ndarray, triangles: np.ndarray) -> float:
+    """Volume enclosed by a closed triangle mesh."""
+    return abs(float(np.sum(triangle_volumes(coords, triangles))))
+
+
+def mesh_area(coords: np.ndarray, triangles: np.ndarray) -> float:
+    """Surface area of a triangle mesh."""
+    return float(np.sum(triangle_areas(coords, triangles)))
+
+
+def read_mesh(obj_eval) -> tuple[np.ndarray, np.ndarray, np.ndarray, bool]:
+    """Read the mesh of an evaluated object as arrays.
+
+    Args:
+        obj_eval: The evaluated object.
+
+    Returns:
+        The (V, 3) array of local vertex coordinates, the (P,) array of
+        polygon sizes, the (L,) array of vertex indices of polygon loops, and
+        whether the mesh is shaded smooth.
+    """
+    mesh = obj_eval.to_mesh()
+    verts = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", verts)
+    sizes = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", sizes)
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    smooth = bool(len(mesh.polygons) and mesh.polygons[0].use_smooth)
+    obj_eval.to_mesh_clear()
+    return verts.reshape(-1, 3), sizes, loops, smooth
+
+
+def write_mesh(
+    mesh, verts: np.ndarray, sizes: np.ndarray, loops: np.ndarray, smooth: bool
+):
+    """Replace the geometry of a mesh with arrays, as read by :func:`read_mesh`.
+
+    Args:
+        mesh: The Blender mesh.
+        verts: (V, 3) array of vertex coordinates.
+        sizes: (P,) array of polygon sizes.
+        loops: (L,) array of vertex indices of polygon loops.
+        smooth: Whether to shade the mesh smooth.
+    """
+    faces = np.split(loops, np.cumsum(sizes)[:-1]) if len(sizes) else []
+    mesh.clear_geometry()
+    mesh.from_pydata(verts.tolist(), [], [face.tolist() for face in faces])
+    mesh.polygons.foreach_set("use_smooth", np.full(len(faces), smooth))
+    mesh.update()
+
+
+class CellGeometry:
+    """A snapshot of the evaluated geometry of a list of cells.
+
+    The world-space vertex coordinates of all cells are read once into a
+    single contiguous array, in which the vertices of the i-th cell are given
+    by ``coords[offsets[i]:offsets[i + 1]]``. Batched quantities (centers of
+    mass, volumes, eigen-axes, bounding boxes and spheres) are computed over all cells
+    at once on first access, and cached for the lifetime of the snapshot.
+    Volumes and surface areas are computed from the loop triangles of each
+    mesh, without any `bmesh` round-trip.
+
+    Evaluated objects, vertex and triangle buffers are read through the
+    per-frame cache of each cell, so that capturing a snapshot does not
+    evaluate cells again.
+
+    Args:
+        cells: The cells to capture.
+
+    Attributes:
+        names (list[str]): Names of the captured cells, in order.
+        coords (np.ndarray): (V, 3) array of world-space vertex coordinates.
+        offsets (np.ndarray): (N + 1,) array of vertex offsets of each cell.
+        triangles (np.ndarray): (T, 3) array of triangles, as indices into
+            `coords`.
+        tri_offsets (np.ndarray): (N + 1,) array of triangle offsets of each cell.
+        matrices (list[Matrix]): Object to world matrices of each cell.
+    """
+
+    def __init__(self, cells: list):
+        self.names = [cell.name for cell in cells]
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self.matrices = []
+
+        coords, triangles = [], []
+        counts = np.zeros(len(cells), dtype=np.int64)
+        tri_counts = np.zeros(len(cells), dtype=np.int64)
+        n_verts = 0
+        for i, cell in enumerate(cells):
+            verts = cell.vertices_array()
+            tris = cell._triangle_buffer()
+            self.matrices.append(cell.matrix_world)
+            coords.append(verts)
+            triangles.append(tris + n_verts)
+
+            counts[i] = len(verts)
+            tri_counts[i] = len(tris)
+            n_verts += counts[i]
+
+        self.coords = np.concatenate(coords) if coords else np.empty((0, 3))
+        self.triangles = (
+            np.concatenate(triangles) if triangles else np.empty((0, 3), dtype=np.int32)
+        )
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.tri_offsets = np.concatenate(([0], np.cumsum(tri_counts)))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, cell) -> bool:
+        return cell.name in self._index
+
+    def index(self, cell) -> int:
+        """Returns the index of a cell in the snapshot.
+
+        Raises:
+            KeyError: If the cell was not captured by this snapshot.
+        """
+        return self._index[cell.name]
+
+    # ----- BATCHED QUANTITIES -----
+    @cached_property
+    def counts(self) -> np.ndarray:
+        """(N,) array of the number of vertices of each cell."""
+        return np.diff(self.offsets)
+
+    @cached_property
+    def coms(self) -> np.ndarray:
+        """(N, 3) array of the centers of mass of each cell."""
+        sums = _segment_sum(self.coords, self.offsets)
+        return sums / np.maximum(self.counts, 1)[:, None]
+
+    @cached_property
+    def volumes(self) -> np.ndarray:
+        """(N,) array of the volumes of each cell, by the divergence theorem."""
+        signed = triangle_volumes(self.coords, self.triangles)
+        return np.abs(_segment_sum(signed, self.tri_offsets))
+
+    def volumes_of(self, indices: np.ndarray) -> np.ndarray:
+        """Volumes of a subset of cells, given by their indices.
+
+        Batched volumes are reused if they have already been computed;
+        otherwise only the triangles of the requested cells are evaluated.
+        """
+        if "volumes" in self.__dict__:
+            return self.volumes[indices]
+        out = np.zeros(len(indices))
+        for k, i in enumerate(indices):
+            tris = self.triangles[self.tri_offsets[i]:self.tri_offsets[i + 1]]
+            out[k] = abs(np.sum(triangle_volumes(self.coords, tris)))
+        return out
+
+    @cached_property
+    def areas(self) -> np.ndarray:
+        """(N,) array of the surface areas of each cell."""
+        areas = triangle_areas(self.coords, self.triangles)
+        return _segment_sum(areas, self.tri_offsets)
+
+    @cached_property
+    def covariances(self) -> np.ndarray:
+        """(N, 3, 3) array of the covariance matrices of the vertices of each cell."""
+        centered = self.coords - np.repeat(self.coms, self.counts, axis=0)
+        outer = centered[:, :, None] * centered[:, None, :]
+        sums = _segment_sum(outer, self.offsets)
+        return sums / np.maximum(self.counts - 1, 1)[:, None, None]
+
+    @cached_property
+    def eigen(self) -> tuple[np.ndarray, np.ndarray]:
+        """Eigenvalues (N, 3) and eigenvectors (N, 3, 3) of the covariance
+        matrices of each cell, sorted by decreasing eigenvalue. The nth
+        eigenvector of the ith cell is given by ``eigenvectors[i, :, n]``.
+        """
+        eigenvalues, eigenvectors = np.linalg.eigh(self.covariances)
+        order = np.argsort(eigenvalues, axis=1)[:, ::-1]
+        eigenvalues = np.take_along_axis(eigenvalues, order, axis=1)
+        eigenvectors = np.take_along_axis(eigenvectors, order[:, None, :], axis=2)
+        return eigenvalues, eigenvectors
+
+    def axis_lengths(self, n: int) -> np.ndarray:
+        """(N,) array of the lengths of the nth eigen-axis of each cell, i.e.
+        the distances between the vertices of extreme projections along it.
+
+        See :func:`axis`.
+        """
+        vecs = np.repeat(self.eigen[1][:, :, n], self.counts, axis=0)
+        projections = np.einsum("ij,ij->i", self.coords, vecs)
+        segments = np.repeat(np.arange(len(self)), self.counts)
+        order = np.lexsort((projections, segments))
+
+        out = np.zeros(len(self))
+        nonempty = self.counts > 0
+        first = order[self.offsets[:-1][nonempty]]
+        last = order[self.offsets[1:][nonempty] - 1]
+        out[nonempty] = np.linalg.norm(self.coords[last] - self.coords[first], axis=1)
+        return out
+
+    @cached_property
+    def radii(self) -> np.ndarray:
+        """(N,) array of the radii of the bounding spheres of each cell,
+        centered on their centers of mass.
+        """
+        centered = self.coords - np.repeat(self.coms, self.counts, axis=0)
+        dists = np.linalg.norm(centered, axis=1)
+        out = np.zeros(len(self))
+        nonempty = self.counts > 0
+        if np.any(nonempty):
+            starts = self.offsets[:-1][nonempty]
+            out[nonempty] = np.maximum.reduceat(dists, starts)
+        return out
+
+    @cached_property
+    def bounds(self) -> np.ndarray:
+        """(N, 2, 3) array of the minimum and maximum corners of the
+        axis-aligned bounding box of each cell. Empty cells have NaN bounds.
+        """
+        out = np.full((len(self), 2, 3), np.nan)
+        nonempty = self.counts > 0
+        if np.any(nonempty):
+            starts = self.offsets[:-1][nonempty]
+            out[nonempty, 0] = np.minimum.reduceat(self.coords, starts, axis=0)
+            out[nonempty, 1] = np.maximum.reduceat(self.coords, starts, axis=0)
+        return out
+
+    # ----- PER-CELL ACCESS -----
+    def vertices(self, cell) -> np.ndarray:
+        """Returns the (n, 3) array of world-space vertices of a cell."""
+        i = self.index(cell)
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def com(self, cell) -> Vector:
+        """Returns the center of mass of a cell."""
+        return Vector(self.coms[self.index(cell)])
+
+    def volume(self, cell) -> float:
+        """Returns the volume of a cell."""
+        return float(self.volumes[self.index(cell)])
+
+    def area(self, cell) -> float:
+        """Returns the surface area of a cell."""
+        return float(self.areas[self.index(cell)])
+
+    def axis(self, cell, n: int) -> Axis:
+        """Returns the nth eigen-axis of a cell.
+
+        See :func:`goo.cell.Cell._get_eigenvector`.
+        """
+        i = self.index(cell)
+        verts = self.vertices(cell)
+        axis = self.eigen[1][i, :, n]
+
+        projections = verts @ axis
+        first_vertex = Vector(verts[np.argmin(projections)])
+        last_vertex = Vector(verts[np.argmax(projections)])
+
+        return Axis(Vector(axis), first_vertex, last_vertex, self.matrices[i])
+
+    def major_axis(self, cell) -> Axis:
+        """Returns the major axis of a cell."""
+        return self.axis(cell, 0)
+
+    def minor_axis(self, cell) -> Axis:
+        """Returns the minor axis of a cell."""
+        return self.axis(cell, 1)
+
+
+class GeometryCache:
+    """Shares a :class:`CellGeometry` snapshot between handlers.
+
+    The snapshot is captured on first request in each frame and reused by all
+    subsequent requests in the same frame. Handlers that modify cell meshes
+    mid-frame (e.g. division or remeshing) must call :func:`invalidate`.
+
+    Args:
+        get_cells: A function that, when called, retrieves the list of cells
+            to capture.
+
+    Attributes:
+        generation (int): Number of times the cache has been invalidated, e.g.
+            to detect changes of cells within a frame.
+    """
+
+    def __init__(self, get_cells: Callable[[], list]):
+        self.get_cells = get_cells
+        self.generation = 0
+        self._snapshot: CellGeometry = None
+        self._frame: int = None
+
+    def get(self) -> CellGeometry:
+        """Returns the snapshot of the current frame, capturing it if needed."""
+        frame = bpy.context.scene.frame_current
+        if self._snapshot is None or self._frame != frame:
+            self._snapshot = CellGeometry(self.get_cells())
+            self._frame = frame
+        return self._snapshot
+
+    def peek(self) -> Optional[CellGeometry]:
+        """Returns the snapshot of the current frame if it has already been
+        captured, without capturing it otherwise."""
+        frame = bpy.context.scene.frame_current
+        if self._snapshot is not None and self._frame == frame:
+            return self._snapshot
+        return None
+
+    def invalidate(self):
+        """Discard the current snapshot, forcing it to be captured again."""
+        self._snapshot = None
+        self.generation += 1
@@ -1,22 +1,150 @@
-from typing import Callable
+from typing import Callable, Union
 from typing_extensions import override
 
 from enum import Enum, Flag, auto
-from datetime import datetime
-import json
+from datetime import datetime, timedelta
 
 import numpy as np
-from scipy.spatial.distance import cdist, pdist, squareform
 import bpy
 import bmesh
 from mathutils import Vector
-from goo.cell import Cell
+from goo.cell import Cell, CellType
+from goo.utils import make_rng
+from goo.geometry import CellGeometry, GeometryCache
+from goo.contact import (
+    ContactGraph,
+    contact_area,
+    contact_candidates,
+    parallel_contact_areas,
+    shutdown_executors,
+)
+from goo.exporter import (
+    DataWriter,
+    ExportFormat,
+    create_writer,
+    load_columns,
+    load_data,
+)
+
+
+class Schedule:
+    """Frames at which a handler runs.
+
+    A handler runs on frame `f` if ``start <= f <= end`` and ``f - offset`` is
+    a multiple of `every`.
+
+    Args:
+        every: Number of frames between runs.
+        offset: Phase of runs, in frames.
+        start: First frame at which the handler may run. Unbounded if None.
+        end: Last frame at which the handler may run. Unbounded if None.
+    """
+
+    def __init__(
+        self, every: int = 1, offset: int = 0, start: int = None, end: int = None
+    ):
+        if every < 1:
+            raise ValueError(f"Handlers must run every 1 or more frames, got {every}.")
+        self.every = every
+        self.offset = offset
+        self.start = start
+        self.end = end
+
+    def due(self, frame: int) -> bool:
+        """Whether the handler runs on a frame."""
+        if self.start is not None and frame < self.start:
+            return False
+        if self.end is not None and frame > self.end:
+            return False
+        return (frame - self.offset) % self.every == 0
+
+
+class FrameContext:
+    """State shared by all handlers during a frame.
+
+    Built once per frame by the dispatcher of the :class:`Simulator`, such
+    that cell lists, the evaluated depsgraph and geometry are not rebuilt by
+    every handler.
+
+    Args:
+        scene: The Blender scene.
+        depsgraph: The evaluated dependency graph.
+        geometry: The geometry cache of the simulation.
+
+    Attributes:
+        scene (bpy.types.Scene): The Blender scene.
+        frame (int): The current frame.
+        depsgraph (bpy.types.Depsgraph): The evaluated dependency graph.
+    """
+
+    def __init__(self, scene, depsgraph, geometry: GeometryCache):
+        self.scene = scene
+        self.frame = scene.frame_current
+        self.depsgraph = depsgraph
+        self._geometry = geometry
+        self._cells: dict = {}
+
+    @property
+    def geometry(self) -> CellGeometry:
+        """The geometry snapshot of the frame."""
+        return self._geometry.get()
+
+    def cells(self, key, build: Callable[[], list[Cell]]) -> list[Cell]:
+        """Returns a list of cells, built once per frame, and again when cells
+        change within the frame (i.e. when the geometry cache is invalidated).
+
+        The returned list is shared between handlers, and must not be
+        modified.
+
+        Args:
+            key: Key identifying the list, e.g. its cell types.
+            build: Function building the list.
+        """
+        generation = self._geometry.generation
+        if key not in self._cells or self._cells[key][0] != generation:
+            self._cells[key] = (generation, build())
+        return self._cells[key][1]
 
 
 class Handler:
+    """Base class of handlers.
+
+    Each handler draws random numbers from its own stream, identified by
+    `rng_key` and derived from the seed of the simulation, such that adding
+    handlers or cells does not perturb other stochastic processes. Streams of
+    individual cells are derived from the stream of the handler.
+
+    Attributes:
+        geometry (GeometryCache): Geometry cache shared between handlers.
+        rng_key (tuple): Key of the random stream of the handler. Set by the
+            :class:`Simulator` to the class name of the handler and its
+            occurrence among handlers of the same class.
+        seed (int): Seed overriding the seed of the simulation, if set.
+        rng (np.random.Generator): Random number generator of the handler.
+        schedule (Schedule): Frames at which the handler runs, as enforced by
+            the :class:`Simulator`. Runs every frame if None.
+        context (FrameContext): Context of the current frame, set by the
+            dispatcher of the :class:`Simulator` while handlers run, and
+            None otherwise.
+        processed (int): Number of cells processed by the last run, as
+            recorded by the :class:`Profiler`. Set by handlers in `run`, and
+            None if not reported.
+    """
+
+    geometry: GeometryCache = None
+    rng_key: tuple = None
+    seed: int = None
+    schedule: Schedule = None
+    context: FrameContext = None
+    processed: int = None
+
     def setup(self, get_cells: Callable[[], list[Cell]], dt: float):
         """Set up the handler.
 
+        If no geometry cache has been shared with the handler (e.g. by the
+        :class:`Simulator`), a private one is created over `get_cells`. The
+        random number generator of the handler is (re)seeded.
+
         Args:
             get_cells: A function that, when called, 
                 retrieves the list of cells that may divide.
@@ -24,6 +152,23 @@ class Handler:
         """
         self.get_cells = get_cells
         self.dt = dt
+        if self.geometry is None:
+            self.geometry = GeometryCache(get_cells)
+        if self.rng_key is None:
+            self.rng_key = (type(self).__name__, 0)
+        self.rng = make_rng(*self.rng_key, seed=self.seed)
+        self._cell_rngs: dict[str, np.random.Generator] = {}
+
+    def cell_rng(self, cell: Cell) -> np.random.Generator:
+        """Returns the random number generator of a cell for this handler.
+
+        Cells get a new stream on division, as daughter cells are renamed.
+        """
+        if cell.name not in self._cell_rngs:
+            self._cell_rngs[cell.name] = make_rng(
+                *self.rng_key, cell.name, seed=self.seed
+            )
+        return self._cell_rngs[cell.name]
 
     def run(self, scene: bpy.types.Scene, depsgraph: bpy.types.Depsgraph):
         """Run the handler.
@@ -37,6 +182,38 @@ class Handler:
         """
         raise NotImplementedError("Subclasses must implement run() method.")
 
+    def close(self):
+        """Release resources held by the handler at the end of a simulation."""
+        pass
+
+    def get_state(self) -> dict:
+        """Returns the state of the handler, to be saved in checkpoints.
+
+        The state must be serializable to JSON. Subclasses holding state
+        between frames extend the state of their base class.
+        """
+        return {
+            "rng": self.rng.bit_generator.state,
+            "cell_rngs": {
+                name: rng.bit_generator.state for name, rng in self._cell_rngs.items()
+            },
+        }
+
+    def set_state(self, state: dict):
+        """Restore the state of the handler from a checkpoint.
+
+        Called after the cells of the checkpoint have been restored.
+
+        Args:
+            state: State returned by :func:`get_state`.
+        """
+        self.rng.bit_generator.state = state["rng"]
+        self._cell_rngs.clear()
+        for name, rng_state in state["cell_rngs"].items():
+            rng = make_rng(*self.rng_key, name, seed=self.seed)
+            rng.bit_generator.state = rng_state
+            self._cell_rngs[name] = rng
+
 # TODO: make voxel_size the same for remesh function and remesh handler
 # TODO: remeshing seems to interfere with motion
 class RemeshHandler(Handler):
@@ -59,11 +236,13 @@ class RemeshHandler(Handler):
 
     @override
     def run(self, scene, depsgraph):
+        self.processed = 0
         if scene.frame_current % self.freq != 0:
             return
         for cell in self.get_cells():
             if not cell.physics_enabled:
                 continue
+            self.processed += 1
 
             # Update mesh and disable physics
             bm = bmesh.new()
@@ -91,6 +270,7 @@ class RemeshHandler(Handler):
             # Recenter and re-enable physics
             cell.enable_physics()
             cell.cloth_mod.point_cache.frame_start = scene.frame_current
+        self.geometry.invalidate()
 
     def _cast_to_sphere(self, cell, factor):
         with bpy.context.temp_override(active_object=cell.obj, object=cell.obj):
@@ -104,27 +284,107 @@ class AdhesionLocationHandler(Handler):
 
     @override
     def run(self, scene, depsgraph):
-        for cell in self.get_cells():
-            cell_size = cell.major_axis().length() / 2
+        geometry = self.geometry.get()
+        cells = self.get_cells()
+        for cell in cells:
+            cell_size = geometry.major_axis(cell).length() / 2
+            com = geometry.com(cell)
 
             for force in cell.adhesion_forces:
                 if not force.enabled():
                     continue
-                force.loc = cell.COM()
+                force.loc = com
                 force.min_dist = cell_size - 0.4
                 force.max_dist = cell_size + 0.4
+        self.processed = len(cells)
 
 
 """Possible types of growth."""
 Growth = Enum("Growth", ["LINEAR", "EXPONENTIAL", "LOGISTIC"])
 
 
+class _PIDState:
+    """PID controller state of a group of cells, stored as arrays.
+
+    Each cell is assigned a stable row on registration, which indexes every
+    array of the state. Transient arrays track convergence of cells, and are
+    neither inherited nor written to custom properties.
+    """
+
+    fields = (
+        "Kp",
+        "Ki",
+        "Kd",
+        "PID_scale",
+        "growth_rate",
+        "integral",
+        "previous_error",
+        "previous_pressure",
+        "next_volume",
+        "target_volume",
+        "volume",
+    )
+    transient = ("steady_frames", "mesh_generation")
+
+    def __init__(self):
+        self.rows: dict[Cell, int] = {}
+        self.cells: list[Cell] = []
+        self._arrays = {
+            field: np.zeros(8) for field in self.fields + self.transient
+        }
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        return self._arrays[field][: len(self.cells)]
+
+    def add(self, cell: Cell, values: dict[str, float]) -> int:
+        """Register a cell with initial values, and return its row."""
+        row = len(self.cells)
+        if row == len(self._arrays["Kp"]):
+            for field, array in self._arrays.items():
+                self._arrays[field] = np.concatenate((array, np.zeros(len(array))))
+        self.rows[cell] = row
+        self.cells.append(cell)
+        for field in self.fields:
+            self._arrays[field][row] = values[field]
+        self._arrays["steady_frames"][row] = 0
+        self._arrays["mesh_generation"][row] = cell.mesh_generation
+        return row
+
+    def values(self, row: int) -> dict[str, float]:
+        """Returns the values of a row."""
+        return {field: float(self._arrays[field][row]) for field in self.fields}
+
+    def sync(self, cell: Cell):
+        """Write the values of a cell to its custom properties."""
+        for field, value in self.values(self.rows[cell]).items():
+            cell[field] = value
+
+
 class GrowthPIDHandler(Handler):
     """Handler for simulating cell growth based off of internal pressure.
 
     Growth is determined by a PID controller, in which changes to a cell's
     internal pressure governs how much it grows in the next frame.
 
+    The state of the controller of each cell is kept in arrays per cell type,
+    such that all growth laws and controller updates are computed at once.
+    Pressures are written back to cells every frame; the state is written to
+    custom properties of cells every `sync_freq` frames and when the
+    simulation ends, e.g. to be kept in save files. Readers of these custom
+    properties during a run, e.g. :class:`ColorizeHandler` with
+    :attr:`Colorizer.PROPERTY` and ``prop="volume"``, see their values as of
+    the last write. Cells that already hold custom properties when first seen
+    (e.g. from a save file) resume from them.
+
+    If `tolerance` is set, cells whose volume has reached their target volume
+    within `tolerance` for `steady_frames` consecutive frames are considered
+    converged: their volumes are no longer evaluated and their pressures are
+    held, except every `recheck_freq` frames. Volumes of other cells are read
+    from the geometry snapshot of the frame if another handler has captured
+    it, and otherwise computed from their meshes only. Converged cells are updated
+    again as soon as they divide or their mesh is rebuilt (e.g. by
+    :class:`RemeshHandler`), or as soon as a re-check finds them off target.
+
     Attributes:
         growth_type (Growth): Type of growth exhibited by cells.
         growth_rate (float): Rate of growth of cells.
@@ -133,6 +393,16 @@ class GrowthPIDHandler(Handler):
         Kp (float): P variable of the PID controller.
         Ki (float): I variable of the PID controller.
         Kd (float): D variable of the PID controller.
+        sync_freq (int): Number of frames between writes of the controller
+            state to custom properties of cells. If set to 0, the state is
+            only written when the simulation ends or is checkpointed, which
+            saves time when no handler reads these properties.
+        tolerance (float): Relative volume error below which cells at their
+            target volume are considered steady. Disabled if set to 0.
+        steady_frames (int): Number of consecutive steady frames after which
+            cells are considered converged.
+        recheck_freq (int): Number of frames between updates of converged
+            cells.
     """
 
     def __init__(
@@ -144,6 +414,10 @@ class GrowthPIDHandler(Handler):
         Kp=0.05,
         Ki=0.00001,
         Kd=0.5,
+        sync_freq: int = 1,
+        tolerance: float = 0,
+        steady_frames: int = 5,
+        recheck_freq: int = 10,
     ):
         self.growth_type = growth_type
         self.growth_rate = growth_rate  # in cubic microns per frame
@@ -153,10 +427,16 @@ class GrowthPIDHandler(Handler):
         self.PID_scale = 60
         self.initial_pressure = initial_pressure
         self.target_volume = target_volume
+        self.sync_freq = sync_freq
+        self.tolerance = tolerance
+        self.steady_frames = steady_frames
+        self.recheck_freq = recheck_freq
+        self._states: dict[CellType, _PIDState] = {}
 
     @override
     def setup(self, get_cells: Callable[[], list[Cell]], dt):
         super(GrowthPIDHandler, self).setup(get_cells, dt)
+        self._states.clear()
         for cell in self.get_cells():
             self.initialize_PID(cell)
 
@@ -166,64 +446,179 @@ class GrowthPIDHandler(Handler):
         Args:
             cell: Cell to initialize PID controller.
         """
-        cell["Kp"] = self.Kp
-        cell["Ki"] = self.Ki
-        cell["Kd"] = self.Kd
-        cell["PID_scale"] = self.PID_scale
-        cell["growth_rate"] = self.growth_rate
+        volume = self._volumes([cell])[0]
+        values = {
+            "Kp": self.Kp,
+            "Ki": self.Ki,
+            "Kd": self.Kd,
+            "PID_scale": self.PID_scale,
+            "growth_rate": self.growth_rate,
+            "integral": 0,
+            "previous_error": 0,
+            "previous_pressure": self.initial_pressure,
+            "next_volume": volume,
+            "target_volume": self.target_volume,
+            "volume": volume,
+        }
+        state = self._states.setdefault(cell.celltype, _PIDState())
+        if cell in state.rows:
+            for field, value in values.items():
+                state[field][state.rows[cell]] = value
+        else:
+            state.add(cell, values)
+        state.sync(cell)
 
-        cell["integral"] = 0
-        cell["previous_error"] = 0
+    def _register(self, cell: Cell) -> tuple[_PIDState, int]:
+        """Returns the controller state and row of a cell, registering it if
+        it has not been seen before.
 
-        cell["previous_pressure"] = self.initial_pressure
-        cell["next_volume"] = cell.volume()
-        cell["target_volume"] = self.target_volume
+        A daughter cell inherits the state of its sibling, which has kept the
+        state of the mother cell. Otherwise, the state is read from custom
+        properties of the cell if they exist, or initialized.
+        """
+        state = self._states.setdefault(cell.celltype, _PIDState())
+        if cell in state.rows:
+            return state, state.rows[cell]
+
+        sibling = next(
+            (c for c in state.cells if c.name == cell.name[:-2] + ".0"), None
+        )
+        if cell.name.endswith(".1") and sibling is not None:
+            state.add(cell, state.values(state.rows[sibling]))
+        elif "target_volume" in cell:
+            state.add(
+                cell,
+                {field: cell[field] if field in cell else 0 for field in state.fields},
+            )
+        else:
+            self.initialize_PID(cell)
+        return state, state.rows[cell]
+
+    def _volumes(self, cells: list[Cell]) -> np.ndarray:
+        """Returns the volumes of cells, from the geometry snapshot of the frame
+        if another handler has already captured it, or else from the meshes of
+        these cells only."""
+        geometry = self.geometry.peek()
+        if geometry is not None and all(cell in geometry for cell in cells):
+            indices = np.array([geometry.index(cell) for cell in cells], dtype=np.intp)
+            return geometry.volumes_of(indices)
+        return np.array([cell.volume() for cell in cells], dtype=np.float64)
+
+    def _grow(self, next_volume: np.ndarray, growth_rate, target_volume) -> np.ndarray:
+        """Returns the next volumes of cells, according to the growth law."""
+        match self.growth_type:
+            case Growth.LINEAR:
+                next_volume = next_volume + growth_rate * self.dt
+            case Growth.EXPONENTIAL:
+                next_volume = next_volume * (1 + growth_rate * self.dt)
+            case Growth.LOGISTIC:
+                next_volume = next_volume * (
+                    1 + growth_rate * (1 - next_volume / target_volume) * self.dt
+                )
+            case _:
+                raise ValueError(
+                    "Growth type must be one of LINEAR, EXPONENTIAL, or LOGISTIC."
+                )
+        return np.minimum(next_volume, target_volume)
+
+    def _update(self, state: _PIDState, rows: np.ndarray, volumes: np.ndarray):
+        """Update the controllers of the cells in the given rows, and return
+        their new pressures.
+        """
+        next_volume = self._grow(
+            state["next_volume"][rows],
+            state["growth_rate"][rows],
+            state["target_volume"][rows],
+        )
+        volume_deviation = 1 - volumes / next_volume
+
+        # Update pressure based on PID output
+        error = volume_deviation
+        integral = state["integral"][rows] + error
+        derivative = error - state["previous_error"][rows]
+        pid = (
+            state["Kp"][rows] * error
+            + state["Ki"][rows] * integral
+            + state["Kd"][rows] * derivative
+        )
+        pressure = state["previous_pressure"][rows] + pid * state["PID_scale"][rows]
+
+        # Update previous error and pressure for the next iteration
+        state["volume"][rows] = volumes
+        state["next_volume"][rows] = next_volume
+        state["previous_error"][rows] = error
+        state["integral"][rows] = integral
+        state["previous_pressure"][rows] = pressure
+
+        if self.tolerance:
+            # relative, as logistic growth only approaches the target volume
+            at_target = (
+                np.abs(1 - next_volume / state["target_volume"][rows]) < self.tolerance
+            )
+            steady = at_target & (np.abs(error) < self.tolerance)
+            state["steady_frames"][rows] = np.where(
+                steady, state["steady_frames"][rows] + 1, 0
+            )
+        return pressure
+
+    def _converged(self, state: _PIDState, row: int, cell: Cell) -> bool:
+        """Whether a cell has converged, i.e. can be skipped this frame."""
+        if state["mesh_generation"][row] != cell.mesh_generation:
+            state["mesh_generation"][row] = cell.mesh_generation
+            state["steady_frames"][row] = 0
+        return bool(
+            self.tolerance and state["steady_frames"][row] >= self.steady_frames
+        )
+
+    def sync(self):
+        """Write the state of the controller of each cell to its custom
+        properties."""
+        for state in self._states.values():
+            for cell in state.cells:
+                state.sync(cell)
 
     @override
     def run(self, scene, depsgraph):
+        recheck = self.recheck_freq and scene.frame_current % self.recheck_freq == 0
+        groups: dict[_PIDState, list[Cell]] = {}
         for cell in self.get_cells():
-            if "target_volume" not in cell:
-                self.initialize_PID(cell)
+            state, row = self._register(cell)
             if "divided" in cell and cell["divided"]:
                 # if divided, reset certain values
-                cell["previous_pressure"] = self.initial_pressure
-                cell["next_volume"] = cell.volume()
+                state["previous_pressure"][row] = self.initial_pressure
+                state["next_volume"][row] = self._volumes([cell])[0]
+                state["steady_frames"][row] = 0
             if not cell.physics_enabled:
                 continue
+            if self._converged(state, row, cell) and not recheck:
+                continue
+            groups.setdefault(state, []).append(cell)
 
-            cell["volume"] = cell.volume()
-
-            match self.growth_type:
-                case Growth.LINEAR:
-                    cell["next_volume"] += cell["growth_rate"] * self.dt
-                case Growth.EXPONENTIAL:
-                    cell["next_volume"] *= 1 + cell["growth_rate"] * self.dt
-                case Growth.LOGISTIC:
-                    cell["next_volume"] = cell["next_volume"] * (
-                        1
-                        + cell["growth_rate"]
-                        * (1 - cell["next_volume"] / cell["target_volume"])
-                        * self.dt
-                    )
-                case _:
-                    raise ValueError(
-                        "Growth type must be one of LINEAR, EXPONENTIAL, or LOGISTIC."
-                    )
-            cell["next_volume"] = min(cell["next_volume"], cell["target_volume"])
-            volume_deviation = 1 - cell["volume"] / cell["next_volume"]
-
-            # Update pressure based on PID output
-            error = volume_deviation
-            integral = cell["integral"] + error
-            derivative = error - cell["previous_error"]
-            pid = cell["Kp"] * error + cell["Ki"] * integral + cell["Kd"] * derivative
-
-            cell.pressure = cell["previous_pressure"] + pid * cell["PID_scale"]
-
-            # Update previous error and pressure for the next iteration
-            cell["previous_error"] = error
-            cell["integral"] = integral
-            cell["previous_pressure"] = cell.pressure
+        for state, cells in groups.items():
+            rows = np.array([state.rows[cell] for cell in cells], dtype=np.intp)
+            pressures = self._update(state, rows, self._volumes(cells))
+            for cell, pressure in zip(cells, pressures):
+                cell.pressure = float(pressure)
+        self.processed = sum(len(cells) for cells in groups.values())
+
+        if self.sync_freq and scene.frame_current % self.sync_freq == 0:
+            self.sync()
+
+    @override
+    def close(self):
+        self.sync()
+
+    @override
+    def get_state(self):
+        # the state of controllers is saved with custom properties of cells
+        self.sync()
+        return super(GrowthPIDHandler, self).get_state()
+
+    @override
+    def set_state(self, state):
+        super(GrowthPIDHandler, self).set_state(state)
+        # cells are registered again from their restored custom properties
+        self._states.clear()
 
 
 """Possible distributions of random motion."""
@@ -235,85 +630,221 @@ class RandomMotionHandler(Handler):
 
     At every frame, the direction of motion is randomized, and the strength
     of the motion force is randomly selected from a specified distribution.
+    Directions and strengths of all cells are drawn at once from a random
+    number generator, and motion forces are placed beyond the major axis of
+    each cell, whose length is read from the shared geometry snapshot and
+    cached until the mesh of the cell is rebuilt or `axis_freq` frames pass.
 
     Attributes:
         distribution (ForceDist): Distribution of random strength of motion force.
         max_strength (int): Maximum strength motion force.
+        axis_freq (int): Number of frames between updates of the cached major
+            axis lengths of cells. Updated every frame if set to 1, and only
+            when meshes are rebuilt if set to 0.
+        seed (int): Seed overriding the seed of the simulation, if set.
     """
 
     def __init__(
         self,
         distribution: ForceDist = ForceDist.UNIFORM,
         max_strength: int = 0,
+        axis_freq: int = 1,
+        seed: int = None,
     ):
         self.distribution = distribution
         self.max_strength = max_strength
+        self.axis_freq = axis_freq
+        self.seed = seed
+        self._axis_lengths: dict[str, tuple[int, float]] = {}
+
+    def _major_axis_lengths(self, cells: list[Cell], frame: int) -> np.ndarray:
+        """Returns the major axis lengths of cells, updating stale cached
+        lengths from the geometry snapshot."""
+        refresh = self.axis_freq and frame % self.axis_freq == 0
+        cached = self._axis_lengths
+        stale = [
+            i
+            for i, cell in enumerate(cells)
+            if refresh
+            or cell.name not in cached
+            or cached[cell.name][0] != cell.mesh_generation
+        ]
+
+        lengths = np.array(
+            [cached.get(cell.name, (0, 0))[1] for cell in cells], dtype=np.float64
+        )
+        if stale:
+            geometry = self.geometry.get()
+            indices = [geometry.index(cells[i]) for i in stale]
+            lengths[stale] = geometry.axis_lengths(0)[indices]
+        self._axis_lengths = {
+            cell.name: (cell.mesh_generation, length)
+            for cell, length in zip(cells, lengths)
+        }
+        return lengths
+
+    @override
+    def set_state(self, state):
+        super(RandomMotionHandler, self).set_state(state)
+        self._axis_lengths.clear()
 
     @override
     def run(self, scene, depsgraph):
-        for cell in self.get_cells():
-            if not cell.physics_enabled:
-                continue
+        # sorted, such that draws do not depend on the order of cell sets
+        cells = sorted(
+            (cell for cell in self.get_cells() if cell.physics_enabled),
+            key=lambda cell: cell.name,
+        )
+        self.processed = n = len(cells)
+        if not cells:
+            return
+
+        dirs = self.rng.uniform(low=-1, high=1, size=(n, 3))
+        match self.distribution:
+            case ForceDist.CONSTANT:
+                strengths = np.full(n, self.max_strength)
+            case ForceDist.UNIFORM:
+                strengths = self.rng.random(n) * self.max_strength
+            case ForceDist.GAUSSIAN:
+                strengths = self.rng.normal(size=n) * self.max_strength
+            case _:
+                raise ValueError(
+                    "Motion noise distribution must be one of UNIFORM or GAUSSIAN."
+                )
+
+        lengths = self._major_axis_lengths(cells, scene.frame_current)
+        locs = np.array([cell.loc for cell in cells])
+        dirs /= np.linalg.norm(dirs, axis=1, keepdims=True)
+        motion_locs = locs + dirs * (2 + lengths)[:, None]
+
+        for cell, strength, motion_loc, loc in zip(cells, strengths, motion_locs, locs):
             if not cell.motion_force.enabled:
                 cell.motion_force.enable()
-
-            dir = Vector(np.random.uniform(low=-1, high=1, size=(3,)))
-            match self.distribution:
-                case ForceDist.CONSTANT:
-                    strength = self.max_strength
-                case ForceDist.UNIFORM:
-                    strength = np.random.random_sample() * self.max_strength
-                case ForceDist.GAUSSIAN:
-                    strength = np.random.normal() * self.max_strength
-                case _:
-                    raise ValueError(
-                        "Motion noise distribution must be one of UNIFORM or GAUSSIAN."
-                    )
-            cell.motion_force.strength = strength
-            cell.move_towards(dir)
+            cell.motion_force.strength = float(strength)
+            cell.motion_force.set_loc(Vector(motion_loc), Vector(loc))
 
 
 """Possible properties by which cells are colored."""
-Colorizer = Enum("Colorizer", ["PRESSURE", "VOLUME", "RANDOM"])
+Colorizer = Enum("Colorizer", ["PRESSURE", "VOLUME", "RANDOM", "PROPERTY"])
+
+"""Built-in colormaps, as evenly spaced (r, g, b) color stops."""
+COLORMAPS = {
+    "bluered": np.array([[0.0, 0.0, 1.0], [1.0, 0.0, 0.0]]),
+    "coolwarm": np.array(
+        [[0.230, 0.299, 0.754], [0.865, 0.865, 0.865], [0.706, 0.016, 0.150]]
+    ),
+    "viridis": np.array(
+        [
+            [0.267, 0.005, 0.329],
+            [0.229, 0.322, 0.546],
+            [0.128, 0.567, 0.551],
+            [0.369, 0.789, 0.383],
+            [0.993, 0.906, 0.144],
+        ]
+    ),
+    "grayscale": np.array([[0.0, 0.0, 0.0], [1.0, 1.0, 1.0]]),
+}
 
 
 class ColorizeHandler(Handler):
     """Handler for coloring cells based off of a specified property.
 
-    Cells are colored on a blue-red spectrum, based on the relative value
-    of the specified property to all other cells. For example, the cell with
-    the highest pressure is colored red, while the cell with an average
-    pressure is colored purple.
+    Cells are colored along a colormap, based on the relative value of the
+    specified property to all other cells. For example, with the default
+    blue-red colormap, the cell with the highest pressure is colored red,
+    while the cell with the lowest pressure is colored blue.
+
+    Values of all cells are gathered and normalized at once, reusing volumes
+    of the geometry snapshot of the frame, and colors are written to the
+    object color of each cell, read by shared cell type materials.
 
     Attributes:
         colorizer (Colorizer): the property by which cells are colored.
+        prop (str): the custom property by which cells are colored, for
+            :attr:`Colorizer.PROPERTY`. Properties written by
+            :class:`GrowthPIDHandler` are as of its last sync, see its
+            `sync_freq`.
+        colormap (str | np.ndarray | Callable): the name of a colormap of
+            :data:`COLORMAPS`, an array of evenly spaced (r, g, b) color
+            stops, or a function mapping an array of values in [0, 1] to an
+            array of colors (e.g. a `matplotlib` colormap).
+        vmin (float): value mapped to the start of the colormap. Defaults to
+            the minimum value over all cells.
+        vmax (float): value mapped to the end of the colormap. Defaults to
+            the maximum value over all cells.
     """
 
-    def __init__(self, colorizer: Colorizer = Colorizer.PRESSURE):
+    def __init__(
+        self,
+        colorizer: Colorizer = Colorizer.PRESSURE,
+        prop: str = None,
+        colormap: Union[str, np.ndarray, Callable] = "bluered",
+        vmin: float = None,
+        vmax: float = None,
+    ):
+        if colorizer == Colorizer.PROPERTY and prop is None:
+            raise ValueError("A custom property must be given to color cells by.")
         self.colorizer = colorizer
+        self.prop = prop
+        self.colormap = colormap
+        self.vmin = vmin
+        self.vmax = vmax
 
-    @override
-    def run(self, scene, depsgraph):
-        red = Vector((1.0, 0.0, 0.0))
-        blue = Vector((0.0, 0.0, 1.0))
-
+    def _values(self, cells: list[Cell]) -> np.ndarray:
+        """Returns the values of the colored property of each cell."""
         match self.colorizer:
             case Colorizer.PRESSURE:
-                ps = np.array([cell.pressure for cell in self.get_cells()])
-                ps = (ps - np.min(ps)) / max(np.max(ps) - np.min(ps), 1)
+                return np.array([cell.pressure for cell in cells], dtype=np.float64)
             case Colorizer.VOLUME:
-                ps = np.array([cell.volume() for cell in self.get_cells()])
-                ps = (ps - np.min(ps)) / max(np.max(ps) - np.min(ps), 1)
+                geometry = self.geometry.get()
+                indices = np.array([geometry.index(cell) for cell in cells], dtype=int)
+                return geometry.volumes_of(indices)
+            case Colorizer.PROPERTY:
+                return np.array([cell[self.prop] for cell in cells], dtype=np.float64)
             case Colorizer.RANDOM:
-                ps = np.random.rand(len(self.get_cells()))
+                names = [cell.name for cell in cells]
+                ps = np.empty(len(names))
+                ps[np.argsort(names)] = self.rng.random(len(names))
+                return ps
             case _:
                 raise ValueError(
-                    "Colorizer must be one of PRESSURE, VOLUME, or RANDOM."
+                    "Colorizer must be one of PRESSURE, VOLUME, RANDOM, or PROPERTY."
                 )
 
-        for cell, p in zip(self.get_cells(), ps):
-            color = blue.lerp(red, p)
-            cell.recolor(tuple(color))
+    def normalize(self, values: np.ndarray) -> np.ndarray:
+        """Normalize values to [0, 1], between `vmin` and `vmax`."""
+        if len(values) == 0:
+            return values
+        vmin = np.min(values) if self.vmin is None else self.vmin
+        vmax = np.max(values) if self.vmax is None else self.vmax
+        if vmax <= vmin:
+            return np.zeros_like(values)
+        return np.clip((values - vmin) / (vmax - vmin), 0, 1)
+
+    def colors(self, ps: np.ndarray) -> np.ndarray:
+        """Map normalized values to (N, 3) array of colors along the colormap."""
+        if callable(self.colormap):
+            return np.asarray(self.colormap(ps))[:, :3]
+        stops = (
+            COLORMAPS[self.colormap]
+            if isinstance(self.colormap, str)
+            else np.asarray(self.colormap)
+        )
+        positions = np.linspace(0, 1, len(stops))
+        return np.stack(
+            [np.interp(ps, positions, stops[:, k]) for k in range(3)], axis=1
+        )
+
+    @override
+    def run(self, scene, depsgraph):
+        cells = self.get_cells()
+        ps = self._values(cells)
+        if self.colorizer != Colorizer.RANDOM:
+            ps = self.normalize(ps)
+
+        for cell, color in zip(cells, self.colors(ps).tolist()):
+            cell.recolor(color)
+        self.processed = len(cells)
 
 
 class SceneExtensionHandler(Handler):
@@ -326,9 +857,11 @@ class SceneExtensionHandler(Handler):
 
     @override
     def run(self, scene, depsgraph):
-        for cell in self.get_cells():
+        cells = self.get_cells()
+        for cell in cells:
             if cell.cloth_mod and cell.cloth_mod.point_cache.frame_end < self.end:
                 cell.cloth_mod.point_cache.frame_end = self.end
+        self.processed = len(cells)
 
 
 def _get_divisions(cells: list[Cell]):
@@ -353,7 +886,7 @@ def _contact_area(cell1: Cell, cell2: Cell, threshold=0.1):
     """Calculate the contact areas between two cells.
 
     Contact is defined as two faces that are within a set threshold distance
-    from each other.
+    from each other. See :func:`goo.contact.contact_area`.
 
     Args:
         cell1: First cell to calculate contact.
@@ -368,57 +901,70 @@ def _contact_area(cell1: Cell, cell2: Cell, threshold=0.1):
             - Ratio of area of cell1 in contact with cell2
             - Ratio of area of cell2 in contact with cell1
     """
-    faces1 = cell1.obj_eval.data.polygons
-    faces2 = cell2.obj_eval.data.polygons
-
-    centers1 = [cell1.obj_eval.matrix_world @ f.center for f in faces1]
-    centers2 = [cell2.obj_eval.matrix_world @ f.center for f in faces2]
-
-    dists = np.array(cdist(centers1, centers2, "euclidean"))
-
-    contact_faces1 = np.any(dists < threshold, axis=1)
-    contact_faces2 = np.any(dists < threshold, axis=0)
-
-    areas1 = np.array([f.area for f in faces1])
-    areas2 = np.array([f.area for f in faces2])
-
-    contact_areas1 = np.sum(areas1[contact_faces1])
-    contact_areas2 = np.sum(areas2[contact_faces2])
-
-    ratio1 = contact_areas1 / np.sum(areas1)
-    ratio2 = contact_areas2 / np.sum(areas2)
-
-    return contact_areas1, contact_areas2, ratio1, ratio2
-
-
-def _contact_areas(cells, threshold=4):
+    centers1, areas1 = cell1.faces_array()
+    centers2, areas2 = cell2.faces_array()
+    return contact_area(centers1, areas1, centers2, areas2, threshold)
+
+
+def _contact_areas(
+    cells,
+    threshold: float = None,
+    geometry: CellGeometry = None,
+    contact_threshold: float = 0.1,
+    workers: int = None,
+    executor: str = "thread",
+):
     """Calculate the pairwise contact areas between a list of cells.
 
-    Contact is calculated heuristically by first screening cells that are within
-    a certain threshold distance between each other.
+    Contact is calculated heuristically by first screening pairs of cells
+    whose bounding spheres are within the contact threshold of each other,
+    using a KD-tree (see :func:`goo.contact.contact_candidates`).
 
     Args:
         cells: The list of cells to calculate contact areas over.
-        threshold: The maximum distance between cells to consider them for contact.
+        threshold: If given, the maximum distance between centers of mass of
+            cells to consider them for contact, instead of their bounding spheres.
+        geometry: Snapshot from which centers of mass and bounding spheres are
+            read. If None, a snapshot of `cells` is captured.
+        contact_threshold: Maximum distance between two faces of either cell to
+            consider as contact. See :func:`_contact_area`.
+        workers: If greater than 1, the number of workers across which pairs
+            are dispatched. Face arrays of all cells are extracted on the main
+            thread first. See :func:`goo.contact.parallel_contact_areas`.
+        executor: Pool of workers to use, either "thread" or "process". See
+            :func:`goo.contact.parallel_contact_areas`.
 
     Returns:
         A list of tuples containing pairwise contact areas and contact ratios.
             See :func:`_contact_area`.
     """
-    coms = [cell.COM() for cell in cells]
-    dists = squareform(pdist(coms, "euclidean"))
-
-    mask = dists < threshold
-    mask = np.triu(mask, k=1)
+    if geometry is None:
+        geometry = CellGeometry(cells)
+    indices = np.array([geometry.index(cell) for cell in cells], dtype=np.intp)
+    coms = geometry.coms[indices]
 
-    pairs = np.where(mask)
+    if threshold is None:
+        pairs = contact_candidates(coms, geometry.radii[indices], contact_threshold)
+    else:
+        pairs = contact_candidates(coms, np.zeros(len(cells)), threshold)
 
     areas = {cell.name: [] for cell in cells}
     ratios = {cell.name: [] for cell in cells}
-    for i, j in zip(pairs[0], pairs[1]):
-        contact_area_i, contact_area_j, ratio_i, ratio_j = _contact_area(
-            cells[i], cells[j]
+    if workers is not None and workers > 1:
+        faces = [cell.faces_array() for cell in cells]
+        centers = np.concatenate([c for c, _ in faces]) if faces else np.empty((0, 3))
+        face_areas = np.concatenate([a for _, a in faces]) if faces else np.empty(0)
+        offsets = np.concatenate(([0], np.cumsum([len(a) for _, a in faces])))
+        results = parallel_contact_areas(
+            centers, face_areas, offsets, pairs, contact_threshold, workers, executor
+        )
+    else:
+        results = (
+            _contact_area(cells[i], cells[j], contact_threshold) for i, j in pairs
         )
+
+    for (i, j), result in zip(pairs, results):
+        contact_area_i, contact_area_j, ratio_i, ratio_j = result
         areas[cells[i].name].append((cells[j].name, contact_area_i))
         areas[cells[j].name].append((cells[i].name, contact_area_j))
         ratios[cells[i].name].append((cells[j].name, ratio_i))
@@ -467,27 +1013,126 @@ class DataExporter(Handler):
         options: (DataFlag): Flags of which metrics to calculated and save/print. 
             Flags can be combined by binary OR operation, 
             i.e. `DataFlag.TIMES | DataFlag.DIVISIONS`.
+        file_format (ExportFormat): Format of the saved file. `JSON` rewrites
+            a single document every frame; `JSONL` and `BINARY` append one
+            record per frame to a file kept open during the simulation, and
+            can be read back with :func:`goo.exporter.load_data`. `NPZ`
+            (a directory of chunks) and `HDF5` store columnar per-frame arrays
+            and a lineage table, and can be read back with
+            :func:`goo.exporter.load_columns`.
+        flush_freq (int): Number of frames between flushes to disk, for the
+            streaming and columnar formats.
+        workers (int): Number of workers across which contact areas are
+            computed. See :func:`_contact_areas`.
+        executor (str): Pool of workers for contact areas, either "thread" or
+            "process", which is not available inside Blender.
+        contact_graph (ContactGraph): If given, contact areas are maintained
+            incrementally across frames by this graph, which may be shared
+            with other handlers. See :class:`goo.contact.ContactGraph`.
     """
 
-    def __init__(self, path="", options: DataFlag = DataFlag.ALL):
+    def __init__(
+        self,
+        path="",
+        options: DataFlag = DataFlag.ALL,
+        file_format: ExportFormat = ExportFormat.JSON,
+        flush_freq: int = 10,
+        workers: int = None,
+        executor: str = "thread",
+        contact_graph: ContactGraph = None,
+    ):
         self.path = path
         self.options = options
+        self.file_format = file_format
+        self.flush_freq = flush_freq
+        self.workers = workers
+        self.executor = executor
+        self.contact_graph = contact_graph
+        self._writer: DataWriter = None
+        self._pending: list[dict] = []
 
     @override
     def setup(self, get_cells: Callable[[], list[Cell]], dt):
         super(DataExporter, self).setup(get_cells, dt)
         self.time_start = datetime.now()
-        out = {"seed": bpy.context.scene["seed"], "frames": []}
+        self._scene_seed = bpy.context.scene["seed"]
+
+        # the file is only created on the first frame, such that a simulation
+        # resumed from a checkpoint appends to the existing file instead
+        self.close()
+        self._writer = None
+        self._pending = []
+        if not self.path:
+            print({"seed": self._scene_seed, "frames": []})
+        self._export(self._record(bpy.context.scene))
+
+    def _open(self):
+        """Create the writer if needed, and write pending records."""
+        if self._writer is None:
+            self._writer = create_writer(
+                self.path, self._scene_seed, self.file_format, self.flush_freq
+            )
+        for frame_out in self._pending:
+            self._writer.write(frame_out)
+        self._pending.clear()
 
-        if self.path:
-            with open(self.path, "w") as f:
-                f.write(json.dumps(out))
+    def _export(self, frame_out: dict):
+        if not self.path:
+            print(frame_out)
+        elif self._writer is None:
+            self._pending.append(frame_out)
         else:
-            print(out)
-        self.run(bpy.context.scene, bpy.context.evaluated_depsgraph_get())
+            self._writer.write(frame_out)
+
+    @override
+    def close(self):
+        if self.path and self._pending:
+            self._open()
+        if self._writer is not None:
+            self._writer.close()
+        shutdown_executors()
+
+    @override
+    def get_state(self):
+        state = super(DataExporter, self).get_state()
+        state["time"] = (datetime.now() - self.time_start).total_seconds()
+        if self.path:
+            self._open()
+            state["writer"] = self._writer.get_state()
+        if self.contact_graph is not None:
+            state["contact_graph"] = self.contact_graph.get_state()
+        return state
+
+    @override
+    def set_state(self, state):
+        super(DataExporter, self).set_state(state)
+        self.time_start = datetime.now() - timedelta(seconds=state["time"])
+        if self.path:
+            # records of the rebuilt scene are discarded, and the file
+            # truncated to the checkpoint
+            if self._writer is not None:
+                self._writer.close()
+            self._pending.clear()
+            self._writer = create_writer(
+                self.path,
+                self._scene_seed,
+                self.file_format,
+                self.flush_freq,
+                state=state["writer"],
+            )
+        if self.contact_graph is not None and "contact_graph" in state:
+            self.contact_graph.set_state(state["contact_graph"])
 
     @override
     def run(self, scene, depsgraph):
+        if self.path and self._writer is None:
+            self._open()
+        record = self._record(scene)
+        self._export(record)
+        self.processed = len(record["cells"])
+
+    def _record(self, scene) -> dict:
+        """Returns the record of the current frame."""
         frame_out = {"frame": scene.frame_current}
 
         if self.options & DataFlag.TIMES:
@@ -495,6 +1140,7 @@ class DataExporter(Handler):
         if self.options & DataFlag.DIVISIONS:
             frame_out["divisions"] = _get_divisions(self.get_cells())
 
+        geometry = self.geometry.get()
         frame_out["cells"] = []
         for cell in self.get_cells():
             cell_out = {"name": cell.name}
@@ -505,20 +1151,21 @@ class DataExporter(Handler):
             if self.options & DataFlag.FORCE_PATH:
                 cell_out["motion_loc"] = tuple(cell.motion_force.loc)
             if self.options & DataFlag.VOLUMES:
-                cell_out["volume"] = cell.volume()
+                cell_out["volume"] = geometry.volume(cell)
             if self.options & DataFlag.PRESSURES and cell.physics_enabled:
                 cell_out["pressure"] = cell.pressure
 
-        if self.options & DataFlag.CONTACT_AREAS:
-            areas, ratios = _contact_areas(self.get_cells())
+        if self.options & DataFlag.CONTACT_AREAS and self.contact_graph:
+            areas, ratios = self.contact_graph.update(self.get_cells(), geometry)
             frame_out["contact_areas"] = areas
             frame_out["contact_ratios"] = ratios
-
-        if self.path:
-            with open(self.path, "r") as f:
-                out = json.load(f)
-                out["frames"].append(frame_out)
-            with open(self.path, "w") as f:
-                f.write(json.dumps(out))
-        else:
-            print(frame_out)
+        elif self.options & DataFlag.CONTACT_AREAS:
+            areas, ratios = _contact_areas(
+                self.get_cells(),
+                geometry=geometry,
+                workers=self.workers,
+                executor=self.executor,
+            )
+            frame_out["contact_areas"] = areas
+            frame_out["contact_ratios"] = ratios
+        return frame_out
@@ -0,0 +1,188 @@
+"""Instrumentation of simulations.
+
+A :class:`Profiler` records the wall time of each handler call and of each
+frame step of a simulation, as well as the number of cells each handler is
+set up over (not all of which it may process, e.g. converged or scheduled
+cells). Since handlers run within the frame step, the time spent in Blender
+itself (mostly physics) is given by the time of frame steps minus the time of
+the handlers run within them, and of the profiler itself.
+
+Example::
+
+    sim = Simulator([celltype])
+    profiler = sim.enable_profiler(trace_path="/tmp/trace.json")
+    ...
+    sim.run(end=100)  # prints a summary, writes a Chrome trace, and resets
+
+Traces can be opened in ``chrome://tracing`` or https://ui.perfetto.dev.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Records timings of handlers and frame steps.
+
+    Args:
+        trace_path: Path to which a Chrome trace is written on :func:`close`.
+
+    Attributes:
+        events (list[dict]): Recorded events, each with a name, a category,
+            a frame, a start time and a duration in seconds, and the number
+            of cells processed for handler events that report it.
+    """
+
+    FRAME = "frame_set"
+    PHYSICS = "physics (frame_set - handlers)"
+
+    def __init__(self, trace_path: str = None):
+        self.trace_path = trace_path
+        self.events: list[dict] = []
+        self._origin = time.perf_counter()
+
+    @contextmanager
+    def record(self, name: str, category: str = "simulator", frame: int = None, **args):
+        """Record the wall time of a block of code as an event.
+
+        Args:
+            name: Name of the event.
+            category: Category of the event.
+            frame: Frame during which the event occurs.
+            **args: Additional values recorded with the event.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.events.append(
+                dict(
+                    name=name,
+                    category=category,
+                    frame=frame,
+                    start=start - self._origin,
+                    duration=end - start,
+                    **args,
+                )
+            )
+
+    def run_handler(self, handler, scene, depsgraph):
+        """Run a handler, recording its wall time and the number of cells it
+        processed, as reported by the handler in its `processed` attribute.
+        """
+        handler.processed = None
+        with self.record(type(handler).__name__, "handler", scene.frame_current):
+            handler.run(scene, depsgraph)
+        if handler.processed is not None:
+            self.events[-1]["cells_processed"] = handler.processed
+
+    def totals(self) -> dict[str, dict]:
+        """Returns statistics of events, grouped by name.
+
+        Returns:
+            A dictionary mapping names of events to their number of calls,
+            total, mean and maximum durations in seconds, and mean number of
+            cells processed if reported. Time spent in frame steps outside of handlers
+            is reported separately.
+        """
+        durations: dict[str, list[float]] = {}
+        cells: dict[str, list[int]] = {}
+        handler_time: dict[int, float] = {}
+        for event in self.events:
+            durations.setdefault(event["name"], []).append(event["duration"])
+            if "cells_processed" in event:
+                cells.setdefault(event["name"], []).append(event["cells_processed"])
+            if event["category"] == "handler":
+                frame = event["frame"]
+                handler_time[frame] = handler_time.get(frame, 0) + event["duration"]
+
+        physics = [
+            event["duration"] - handler_time.get(event["frame"], 0)
+            for event in self.events
+            if event["name"] == self.FRAME
+        ]
+        if physics:
+            durations[self.PHYSICS] = physics
+
+        return {
+            name: {
+                "calls": len(ds),
+                "total": sum(ds),
+                "mean": sum(ds) / len(ds),
+                "max": max(ds),
+                "cells_processed": (
+                    sum(cells[name]) / len(cells[name]) if name in cells else None
+                ),
+            }
+            for name, ds in durations.items()
+        }
+
+    def summary(self) -> str:
+        """Returns a table of statistics of events, sorted by total time."""
+        totals = self.totals()
+        frame_total = totals[self.FRAME]["total"] if self.FRAME in totals else None
+        rows = sorted(totals.items(), key=lambda item: -item[1]["total"])
+
+        width = max([len(name) for name in totals] + [5])
+        lines = [
+            f"{'event':<{width}} {'calls':>7} {'total (s)':>10} {'mean (ms)':>10} "
+            f"{'max (ms)':>10} {'% frame':>8} {'cells processed':>15}"
+        ]
+        for name, stats in rows:
+            percent = (
+                f"{100 * stats['total'] / frame_total:8.1f}"
+                if frame_total and name != self.FRAME
+                else f"{'':>8}"
+            )
+            cells = (
+                f"{stats['cells_processed']:15.0f}"
+                if stats["cells_processed"] is not None
+                else f"{'':>15}"
+            )
+            lines.append(
+                f"{name:<{width}} {stats['calls']:>7d} {stats['total']:>10.3f} "
+                f"{1000 * stats['mean']:>10.2f} {1000 * stats['max']:>10.2f} "
+                f"{percent} {cells}"
+            )
+        return "\n".join(lines)
+
+    def trace(self) -> dict:
+        """Returns recorded events in the Chrome trace event format."""
+        trace_events = []
+        for event in self.events:
+            args = {k: v for k, v in event.items() if k not in ("name", "category")}
+            trace_events.append(
+                {
+                    "name": event["name"],
+                    "cat": event["category"],
+                    "ph": "X",
+                    "ts": 1e6 * event["start"],
+                    "dur": 1e6 * event["duration"],
+                    "pid": 0,
+                    "tid": 0,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: str):
+        """Write recorded events to a Chrome trace JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.trace(), f)
+
+    def close(self):
+        """Print the summary of events, write the trace if a path is set, and
+        discard events, such that each run is reported on its own."""
+        if not self.events:
+            return
+        print("\n" + self.summary())
+        if self.trace_path:
+            self.write_trace(self.trace_path)
+        self.reset()
+
+    def reset(self):
+        """Discard all recorded events."""
+        self.events.clear()
+        self._origin = time.perf_counter()
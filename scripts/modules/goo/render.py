@@ -0,0 +1,508 @@
+"""Simulate-then-render pipeline over baked simulations.
+
+A simulation is first baked with :func:`bake`: after every frame step, the
+evaluated (world-space) mesh and color of every cell are written to a
+``frame_XXXX.npz`` file of a bake directory, and the scene (camera, lights,
+world) is saved alongside as ``scene.blend``::
+
+    bake/
+        bake.json
+        scene.blend
+        frame_0001.npz
+        ...
+
+Any frame range of a bake can then be rendered with :func:`render_baked`,
+without any physics, split into disjoint slices of frames rendered in
+parallel by background Blender processes, and optionally assembled into a
+movie. Baked meshes are displayed by proxy objects, while the original cells
+are hidden; changing the camera, lights or materials of ``scene.blend`` does
+not require simulating again.
+
+Example::
+
+    sim.bake("bake", end=250)
+    render_baked("bake", "frames", workers=4, engine="CYCLES", movie=True)
+
+Large tissues can be rendered at a lower level of detail (see :class:`LOD`),
+e.g. for previews or overviews: the baked meshes of cells are then decimated,
+or replaced by ellipsoids fitted to their principal axes. Levels of detail
+only apply to rendering; cells are always simulated with their full meshes.
+
+Note:
+    Topology of cells changes on division and remeshing, such that cloth point
+    caches cannot be reused across a Goo simulation; meshes are baked instead.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from enum import Enum
+
+import numpy as np
+import bpy
+import bmesh
+from mathutils import Matrix
+
+from goo.geometry import read_mesh, world_coords, write_mesh
+from goo.utils import create_material
+
+
+LOD = Enum("LOD", ["FULL", "DECIMATE", "ELLIPSOID"])
+"""Levels of detail of rendered cells.
+
+* FULL: baked meshes, as simulated.
+* DECIMATE: baked meshes, decimated by a Decimate modifier.
+* ELLIPSOID: a single shared sphere mesh, instanced by every cell and scaled
+  along the principal axes of its baked mesh.
+"""
+
+
+def _frame_path(path: str, frame: int) -> str:
+    return os.path.join(path, f"frame_{frame:04d}.npz")
+
+
+def bake_frame(cells: list, path: str, frame: int):
+    """Write the evaluated meshes, colors and shared materials of cells at the
+    current frame.
+
+    Args:
+        cells: The cells to bake.
+        path: Bake directory.
+        frame: The current frame.
+    """
+    names, verts, sizes, loops, smooth, colors, materials = ([] for _ in range(7))
+    for cell in sorted(cells, key=lambda cell: cell.name):
+        local, s, l, sm = read_mesh(cell.obj_eval)
+        names.append(cell.name)
+        verts.append(world_coords(local.astype(np.float64), cell.matrix_world))
+        sizes.append(s)
+        loops.append(l)
+        smooth.append(sm)
+        colors.append(cell.color)
+        materials.append(cell._mat.name if cell._shared_mat else "")
+
+    def offsets(arrays):
+        return np.concatenate(([0], np.cumsum([len(a) for a in arrays])))
+
+    vertices = np.concatenate(verts) if verts else np.empty((0, 3))
+    np.savez_compressed(
+        _frame_path(path, frame),
+        names=np.array(names, dtype=str),
+        vertices=vertices.astype(np.float32),
+        vertex_offsets=offsets(verts),
+        polygon_sizes=np.concatenate(sizes) if sizes else np.empty(0, np.int32),
+        polygon_offsets=offsets(sizes),
+        loops=np.concatenate(loops) if loops else np.empty(0, np.int32),
+        loop_offsets=offsets(loops),
+        smooth=np.array(smooth, dtype=bool),
+        colors=np.array(colors, dtype=np.float32).reshape(-1, 4),
+        materials=np.array(materials, dtype=str),
+    )
+
+
+def bake(
+    sim, path: str, end: int = 250, start: int = 1, physics_only: bool = False
+):
+    """Run a simulation, baking every frame for later rendering.
+
+    Args:
+        sim: The simulator.
+        path: Bake directory.
+        end: Last frame of the simulation.
+        start: First frame to simulate.
+        physics_only: Whether to simulate in the reduced scene of
+            :func:`Simulator.physics_only`. Modifiers it disables are then
+            missing from baked meshes.
+    """
+    os.makedirs(path, exist_ok=True)
+    scene = bpy.context.scene
+    get_cells = sim.get_cells_func()
+    names = set()
+
+    print("----- BAKE START -----")
+    sim.invalidate_geometry()
+    t_start = time.perf_counter()
+    with sim.physics_only() if physics_only else nullcontext():
+        for i in range(start, end + 1):
+            sim.step(i)
+            cells = get_cells()
+            bake_frame(cells, path, i)
+            names.update(cell.name for cell in cells)
+            print(i, end=" ", flush=True)
+    sim.close_handlers()
+
+    scene.frame_start = start
+    scene.frame_end = end
+    bpy.ops.wm.save_as_mainfile(
+        filepath=os.path.abspath(os.path.join(path, "scene.blend")), copy=True
+    )
+    with open(os.path.join(path, "bake.json"), "w") as f:
+        json.dump(
+            {"start": start, "end": end, "cells": sorted(names), "scene": "scene.blend"},
+            f,
+        )
+    print(f"\nBaked {end - start + 1} frames in {time.perf_counter() - t_start:.1f} s")
+    print("----- BAKE END -----")
+
+
+def fit_ellipsoids(
+    vertices: np.ndarray, offsets: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fit ellipsoids to the vertices of cells, along their principal axes.
+
+    Args:
+        vertices: (V, 3) array of vertices of all cells.
+        offsets: (N + 1,) array of vertex offsets of each cell. Cells must
+            not be empty.
+
+    Returns:
+        Centers (N, 3), rotation matrices (N, 3, 3), whose columns are the
+        principal axes of each cell, and semi-axis lengths (N, 3), i.e. half
+        the extents of the vertices of each cell along its principal axes.
+    """
+    counts = np.diff(offsets)
+    starts = offsets[:-1]
+    centers = np.add.reduceat(vertices, starts, axis=0) / counts[:, None]
+    centered = vertices - np.repeat(centers, counts, axis=0)
+    outer = centered[:, :, None] * centered[:, None, :]
+    covariances = np.add.reduceat(outer, starts, axis=0)
+    _, axes = np.linalg.eigh(covariances)
+    # right-handed rotations
+    axes[np.linalg.det(axes) < 0, :, 0] *= -1
+
+    projections = np.einsum("vi,vij->vj", centered, np.repeat(axes, counts, axis=0))
+    lo = np.minimum.reduceat(projections, starts, axis=0)
+    hi = np.maximum.reduceat(projections, starts, axis=0)
+    mid = (lo + hi) / 2
+    centers += np.einsum("nij,nj->ni", axes, mid)
+    return centers, axes, (hi - lo) / 2
+
+
+def _unit_sphere(name: str, subdivisions: int = 2) -> bpy.types.Mesh:
+    """Returns a smooth icosphere mesh of radius 1."""
+    bm = bmesh.new()
+    bmesh.ops.create_icosphere(bm, subdivisions=subdivisions, radius=1)
+    mesh = bpy.data.meshes.new(name)
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.polygons.foreach_set("use_smooth", [True] * len(mesh.polygons))
+    return mesh
+
+
+class BakedScene:
+    """Displays baked frames in the current scene.
+
+    Original cells are hidden and their modifiers disabled, such that no
+    physics is evaluated; baked meshes are displayed by proxy objects, one per
+    cell, created as needed and hidden on frames in which the cell does not
+    exist. Proxies use the shared material of the cell type of their cell, as
+    found in the scene, colored by their object color.
+
+    Args:
+        path: Bake directory.
+        lod: Level of detail of proxies.
+        decimate_ratio: Ratio of faces kept by decimation, for
+            :attr:`LOD.DECIMATE`.
+    """
+
+    def __init__(self, path: str, lod: LOD = LOD.FULL, decimate_ratio: float = 0.25):
+        self.path = path
+        self.lod = lod
+        self.decimate_ratio = decimate_ratio
+        self._material = create_material(
+            "baked_material", (0.8, 0.8, 0.8), object_color=True
+        )
+        self._sphere = None
+        if lod == LOD.ELLIPSOID:
+            self._sphere = _unit_sphere("baked_sphere")
+            # a single material slot, linked to the material of each proxy
+            self._sphere.materials.append(self._material)
+        with open(os.path.join(path, "bake.json")) as f:
+            self.info = json.load(f)
+        self._proxies: dict[str, bpy.types.Object] = {}
+        self._collection = bpy.data.collections.new("baked_cells")
+        bpy.context.scene.collection.children.link(self._collection)
+
+        for name in self.info["cells"]:
+            obj = bpy.data.objects.get(name)
+            if obj is None:
+                continue
+            for mod in obj.modifiers:
+                mod.show_viewport = False
+                mod.show_render = False
+            obj.hide_viewport = True
+            obj.hide_render = True
+
+    def _proxy(self, name: str, material: str) -> bpy.types.Object:
+        if name not in self._proxies:
+            mat = bpy.data.materials.get(material) if material else None
+            if mat is None or not mat.get("object_color", False):
+                mat = self._material
+            match self.lod:
+                case LOD.ELLIPSOID:
+                    obj = bpy.data.objects.new(f"{name}_baked", self._sphere)
+                    # materials of the shared sphere are set per object
+                    obj.material_slots[0].link = "OBJECT"
+                    obj.material_slots[0].material = mat
+                case _:
+                    mesh = bpy.data.meshes.new(f"{name}_baked_mesh")
+                    mesh.materials.append(mat)
+                    obj = bpy.data.objects.new(f"{name}_baked", mesh)
+                    if self.lod == LOD.DECIMATE:
+                        mod = obj.modifiers.new("Decimate", "DECIMATE")
+                        mod.ratio = self.decimate_ratio
+            self._collection.objects.link(obj)
+            self._proxies[name] = obj
+        return self._proxies[name]
+
+    def show(self, frame: int):
+        """Display the baked meshes of a frame, and set the scene to it."""
+        with np.load(_frame_path(self.path, frame)) as f:
+            data = {k: f[k] for k in f.files}
+        names = [str(name) for name in data["names"]]
+        vo, po, lo = (
+            data[k] for k in ("vertex_offsets", "polygon_offsets", "loop_offsets")
+        )
+        if self.lod == LOD.ELLIPSOID and names:
+            centers, axes, semi_axes = fit_ellipsoids(data["vertices"], vo)
+        for i, name in enumerate(names):
+            obj = self._proxy(name, str(data["materials"][i]))
+            if self.lod == LOD.ELLIPSOID:
+                matrix = np.eye(4)
+                matrix[:3, :3] = axes[i] * np.maximum(semi_axes[i], 1e-6)
+                matrix[:3, 3] = centers[i]
+                obj.matrix_world = Matrix(matrix.tolist())
+            else:
+                write_mesh(
+                    obj.data,
+                    data["vertices"][vo[i]:vo[i + 1]],
+                    data["polygon_sizes"][po[i]:po[i + 1]],
+                    data["loops"][lo[i]:lo[i + 1]],
+                    bool(data["smooth"][i]),
+                )
+            obj.color = data["colors"][i]
+            obj.hide_viewport = obj.hide_render = False
+
+        shown = set(names)
+        for name, obj in self._proxies.items():
+            if name not in shown:
+                obj.hide_viewport = obj.hide_render = True
+        bpy.context.scene.frame_set(frame)
+
+
+def render_frames(
+    path: str,
+    out: str,
+    frames: list[int],
+    engine: str = None,
+    threads: int = 0,
+    lod: LOD = LOD.FULL,
+    decimate_ratio: float = 0.25,
+):
+    """Render baked frames in the current process, to ``out/{i:04d}.png``.
+
+    Meant to be run by render workers, on a scene opened from the saved
+    ``scene.blend``: cells of the scene are hidden and their modifiers
+    disabled, and frame change handlers are removed.
+
+    Args:
+        path: Bake directory.
+        out: Output directory.
+        frames: Frames to render.
+        engine: Render engine, e.g. ``CYCLES`` (rendered on the CPU),
+            ``BLENDER_EEVEE`` or ``BLENDER_WORKBENCH``. Defaults to the
+            engine of the scene.
+        threads: Number of render threads. Defaults to the number of CPUs.
+        lod: Level of detail of rendered cells.
+        decimate_ratio: Ratio of faces kept by decimation, for
+            :attr:`LOD.DECIMATE`.
+    """
+    scene = bpy.context.scene
+    bpy.app.handlers.frame_change_pre.clear()
+    bpy.app.handlers.frame_change_post.clear()
+    if engine:
+        scene.render.engine = engine
+    if scene.render.engine == "CYCLES":
+        scene.cycles.device = "CPU"
+    if threads:
+        scene.render.threads_mode = "FIXED"
+        scene.render.threads = threads
+    scene.render.image_settings.file_format = "PNG"
+
+    baked = BakedScene(path, lod, decimate_ratio)
+    for i in frames:
+        baked.show(i)
+        scene.render.filepath = os.path.join(out, f"{i:04d}")
+        bpy.ops.render.render(write_still=True)
+
+
+def assemble_movie(out: str, frames: list[int], filepath: str = None) -> str:
+    """Assemble rendered frames into an MPEG4 movie with the video sequencer.
+
+    The resolution and frame rate of the movie are those of the current scene,
+    i.e. of the saved ``scene.blend`` when run by :func:`render_baked`.
+
+    Args:
+        out: Directory of rendered frames, named ``{i:04d}.png``.
+        frames: Frames of the movie.
+        filepath: Path of the movie. Defaults to ``out/movie.mp4``.
+
+    Returns:
+        The path of the movie.
+    """
+    filepath = os.path.abspath(filepath or os.path.join(out, "movie.mp4"))
+    render = bpy.context.scene.render
+    scene = bpy.data.scenes.new("goo_movie")
+    try:
+        scene.render.resolution_x = render.resolution_x
+        scene.render.resolution_y = render.resolution_y
+        scene.render.resolution_percentage = render.resolution_percentage
+        scene.render.fps = render.fps
+        scene.frame_start = 1
+        scene.frame_end = len(frames)
+
+        scene.sequence_editor_create()
+        strip = scene.sequence_editor.sequences.new_image(
+            "frames",
+            os.path.join(os.path.abspath(out), f"{frames[0]:04d}.png"),
+            channel=1,
+            frame_start=1,
+        )
+        for i in frames[1:]:
+            strip.elements.append(f"{i:04d}.png")
+
+        scene.render.image_settings.file_format = "FFMPEG"
+        scene.render.ffmpeg.format = "MPEG4"
+        scene.render.ffmpeg.codec = "H264"
+        scene.render.filepath = filepath
+        scene.render.use_file_extension = False
+        bpy.ops.render.render(animation=True, scene=scene.name)
+    finally:
+        bpy.data.scenes.remove(scene)
+    return filepath
+
+
+def _slices(frames: list[int], n: int) -> list[list[int]]:
+    """Split frames into at most n disjoint, contiguous slices."""
+    return [list(s) for s in np.array_split(frames, n) if len(s)]
+
+
+def _worker_command(executable: str, path: str, args: list[str]) -> list[str]:
+    """Returns the command running :func:`main` with arguments on the saved
+    scene of a bake, in a background Blender process, or a Python interpreter
+    with `bpy` installed."""
+    goo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    scene = os.path.join(os.path.abspath(path), "scene.blend")
+    expr = f"import sys; sys.path.insert(0, {goo_path!r}); "
+    if os.path.basename(executable).lower().startswith("blender"):
+        expr += "from goo.render import main; main()"
+        return [executable, "--background", scene, "--python-expr", expr, "--"] + args
+    expr += (
+        f"import bpy; bpy.ops.wm.open_mainfile(filepath={scene!r}); "
+        "from goo.render import main; main()"
+    )
+    return [executable, "-c", expr] + args
+
+
+def render_baked(
+    path: str,
+    out: str,
+    start: int = None,
+    end: int = None,
+    workers: int = 1,
+    engine: str = None,
+    lod: LOD = LOD.FULL,
+    decimate_ratio: float = 0.25,
+    movie: bool = False,
+    executable: str = None,
+) -> str:
+    """Render a frame range of a baked simulation.
+
+    The range is split into disjoint, contiguous slices of frames, each
+    rendered by a background process from the saved ``scene.blend``, such that
+    the current scene is left untouched. CPUs are shared evenly between
+    workers. Frames are written to ``out/{i:04d}.png``, as by
+    :func:`Simulator.render`.
+
+    Args:
+        path: Bake directory.
+        out: Output directory.
+        start: First frame to render. Defaults to the first baked frame.
+        end: Last frame to render. Defaults to the last baked frame.
+        workers: Number of worker processes.
+        engine: Render engine, e.g. ``CYCLES`` (rendered on the CPU),
+            ``BLENDER_EEVEE`` or ``BLENDER_WORKBENCH``. Defaults to the
+            engine of the saved scene.
+        lod: Level of detail of rendered cells, e.g. :attr:`LOD.ELLIPSOID`
+            for previews of large tissues.
+        decimate_ratio: Ratio of faces kept by decimation, for
+            :attr:`LOD.DECIMATE`.
+        movie: Whether to assemble rendered frames into ``out/movie.mp4``,
+            with the resolution and frame rate of the saved scene.
+        executable: Blender executable, or Python interpreter with `bpy`
+            installed, used to launch workers. Defaults to the Blender binary
+            running this process.
+
+    Returns:
+        The path of the movie if assembled, else None.
+
+    Raises:
+        RuntimeError: If any worker, or the assembly of the movie, fails.
+    """
+    with open(os.path.join(path, "bake.json")) as f:
+        info = json.load(f)
+    start = info["start"] if start is None else start
+    end = info["end"] if end is None else end
+    frames = list(range(start, end + 1))
+    os.makedirs(out, exist_ok=True)
+
+    executable = executable or bpy.app.binary_path or sys.executable
+    slices = _slices(frames, max(workers, 1))
+    threads = max((os.cpu_count() or 1) // len(slices), 1) if len(slices) > 1 else 0
+    path, out = os.path.abspath(path), os.path.abspath(out)
+    options = [engine or "", str(threads), lod.name, str(decimate_ratio)]
+    commands = [
+        _worker_command(executable, path, [path, out, f"{s[0]}:{s[-1]}"] + options)
+        for s in slices
+    ]
+    with ThreadPoolExecutor(max_workers=len(commands)) as pool:
+        codes = list(pool.map(lambda cmd: subprocess.run(cmd).returncode, commands))
+    failed = [i for i, code in enumerate(codes) if code != 0]
+    if failed:
+        raise RuntimeError(f"Render workers {failed} failed.")
+
+    if not movie:
+        return None
+    # assembled from the saved scene, for its resolution and frame rate
+    cmd = _worker_command(executable, path, ["--movie", out, f"{start}:{end}"])
+    if subprocess.run(cmd).returncode != 0:
+        raise RuntimeError("Movie assembly failed.")
+    return os.path.join(out, "movie.mp4")
+
+
+def main(argv: list[str] = None):
+    """Entry point of render workers:
+    ``path out start:end [engine [threads [lod [decimate_ratio]]]]``, or
+    ``--movie out start:end`` to assemble rendered frames into a movie."""
+    if argv is None:
+        argv = sys.argv[1:]
+        if "--" in sys.argv:
+            argv = sys.argv[sys.argv.index("--") + 1:]
+    if argv[0] == "--movie":
+        _, out, frame_range = argv
+        start, end = map(int, frame_range.split(":"))
+        assemble_movie(out, list(range(start, end + 1)))
+        return
+    path, out, frame_range, *options = argv
+    start, end = map(int, frame_range.split(":"))
+    engine = options[0] if options else None
+    threads = int(options[1]) if len(options) > 1 else 0
+    lod = LOD[options[2]] if len(options) > 2 else LOD.FULL
+    ratio = float(options[3]) if len(options) > 3 else 0.25
+    render_frames(
+        path, out, list(range(start, end + 1)), engine or None, threads, lod, ratio
+    )
@@ -1,10 +1,18 @@
 import sys
 import os
+import time
+from contextlib import contextmanager, nullcontext
+
 import numpy as np
 import bpy
 
-from goo.handler import Handler
+from goo.handler import FrameContext, Handler, Schedule
 from goo.cell import CellType
+from goo.geometry import GeometryCache
+from goo.checkpoint import load_checkpoint, save_checkpoint
+from goo.contact import shutdown_executors
+from goo.profiler import Profiler
+from goo.render import bake
 
 
 class Simulator:
@@ -12,13 +20,18 @@ class Simulator:
         self.celltypes = celltypes
         self.physics_dt = physics_dt
         self.addons = ["add_mesh_extra_objects"]
+        self.geometry = GeometryCache(self.get_cells_func())
+        self.handlers = []
+        self.profiler: Profiler = None
+        self.context: FrameContext = None
 
     def setup_world(self, seed=1):
         # Enable addons
         for addon in self.addons:
             self.enable_addon(addon)
 
-        # Set random seed
+        # Set random seed, from which handlers derive their own random streams.
+        # The global state is still seeded for legacy consumers.
         np.random.seed(seed)
         bpy.context.scene["seed"] = seed
 
@@ -66,6 +79,24 @@ class Simulator:
         # # set film to transparent to hide background
         bpy.context.scene.render.film_transparent = True
 
+        self.show_object_colors()
+
+    @staticmethod
+    def show_object_colors():
+        """Shade solid views by object color.
+
+        Cells of a type share a material, colored per cell by the object color,
+        which solid shading (of viewports, Workbench and OpenGL renders) only
+        shows when coloring by object.
+        """
+        bpy.context.scene.display.shading.color_type = "OBJECT"
+        # and the solid shading of 3D viewports, if any
+        for screen in bpy.data.screens:
+            for area in screen.areas:
+                for space in area.spaces:
+                    if space.type == "VIEW_3D":
+                        space.shading.color_type = "OBJECT"
+
     def enable_addon(self, addon):
         if addon not in bpy.context.preferences.addons:
             bpy.ops.preferences.addon_enable(module=addon)
@@ -83,20 +114,120 @@ class Simulator:
         self.celltypes.extend(celltypes)
 
     def get_cells_func(self, celltypes=None):
-        celltypes = celltypes if celltypes is not None else self.celltypes
+        """Returns a function retrieving the list of cells of cell types.
+
+        While handlers run, lists are built once per frame and shared through
+        the :class:`FrameContext` of the frame.
+
+        Args:
+            celltypes: Cell types of cells. Defaults to all cell types of the
+                simulation, including ones added later.
+        """
+        key = None if celltypes is None else tuple(map(id, celltypes))
+
+        def build():
+            types = celltypes if celltypes is not None else self.celltypes
+            return [cell for celltype in types for cell in celltype.cells]
 
         def get_cells():
-            return [cell for celltype in celltypes for cell in celltype.cells]
+            if self.context is None:
+                return build()
+            return self.context.cells(key, build)
 
         return get_cells
 
-    def add_handler(self, handler: Handler, celltypes: list[CellType] = None):
+    def add_handler(
+        self,
+        handler: Handler,
+        celltypes: list[CellType] = None,
+        every: int = 1,
+        offset: int = 0,
+        start: int = None,
+        end: int = None,
+    ):
+        """Add a handler to the simulation.
+
+        Handlers are run after every frame change by a single dispatcher, in
+        the order in which they were added, on the frames given by their
+        schedule.
+
+        Args:
+            handler: The handler.
+            celltypes: Cell types on which the handler acts. Defaults to all
+                cell types of the simulation.
+            every: Number of frames between runs of the handler.
+            offset: Phase of runs of the handler, in frames.
+            start: First frame at which the handler may run.
+            end: Last frame at which the handler may run.
+        """
+        index = sum(type(h) is type(handler) for h in self.handlers)
+        handler.rng_key = (type(handler).__name__, index)
+        handler.geometry = self.geometry
+        handler.schedule = Schedule(every, offset, start, end)
         handler.setup(self.get_cells_func(celltypes), self.physics_dt)
-        bpy.app.handlers.frame_change_post.append(handler.run)
+        self.handlers.append(handler)
+        if self._dispatch not in bpy.app.handlers.frame_change_post:
+            bpy.app.handlers.frame_change_post.append(self._dispatch)
 
-    def add_handlers(self, handlers: list[Handler], celltypes: list[CellType] = None):
+    def add_handlers(
+        self, handlers: list[Handler], celltypes: list[CellType] = None, **schedule
+    ):
+        """Add handlers to the simulation, with the same cell types and
+        schedule. See :func:`add_handler`."""
         for handler in handlers:
-            self.add_handler(handler, celltypes)
+            self.add_handler(handler, celltypes, **schedule)
+
+    def _dispatch(self, scene, depsgraph):
+        """Run handlers due on the current frame, in order, sharing a frame
+        context, and instrumented if profiling is enabled."""
+        self.context = FrameContext(scene, depsgraph, self.geometry)
+        try:
+            for handler in self.handlers:
+                if handler.schedule is not None and not handler.schedule.due(
+                    self.context.frame
+                ):
+                    continue
+                handler.context = self.context
+                if self.profiler is None:
+                    handler.run(scene, depsgraph)
+                else:
+                    self.profiler.run_handler(handler, scene, depsgraph)
+        finally:
+            for handler in self.handlers:
+                handler.context = None
+            self.context = None
+
+    def enable_profiler(self, trace_path: str = None) -> Profiler:
+        """Enable profiling of handlers and frame steps.
+
+        A summary is printed at the end of each simulation, and a Chrome trace
+        is written to `trace_path` if set. See :mod:`goo.profiler`.
+
+        Args:
+            trace_path: Path of the Chrome trace JSON file.
+
+        Returns:
+            The profiler of the simulation.
+        """
+        self.profiler = Profiler(trace_path)
+        return self.profiler
+
+    def disable_profiler(self):
+        """Disable profiling."""
+        self.profiler = None
+
+    def step(self, frame: int):
+        """Step the simulation to a frame, running physics and the handlers due
+        on it. The step is timed if profiling is enabled.
+
+        Args:
+            frame: The frame to step to.
+        """
+        if self.profiler is None:
+            bpy.context.scene.frame_set(frame)
+            return
+        with self.profiler.record(Profiler.FRAME, frame=frame):
+            bpy.context.scene.frame_set(frame)
 
     def render(self, start=1, end=250, save=True, path=None, camera=False):
         bpy.context.scene.frame_start = start
@@ -110,20 +241,185 @@ class Simulator:
         elif path and not save:
             print("Save path set but render will not be saved!")
 
+        if not camera:
+            self.show_object_colors()
+
         print("----- SIMULATION START -----")
+        self.invalidate_geometry()
         for i in range(1, end + 1):
-            bpy.context.scene.frame_set(i)
+            self.step(i)
             bpy.context.scene.render.filepath = os.path.join(path, f"{i:04d}")
             if camera:
                 bpy.ops.render.render(write_still=save)
             else:
                 bpy.ops.render.opengl(write_still=save)
         bpy.context.scene.render.filepath = path
+        self.close_handlers()
         print("\n----- SIMULATION END -----")
 
-    def run(self, end=250):
+    def bake(self, path: str, end=250, start=1, physics_only=False):
+        """Run the simulation, baking every frame for later rendering.
+
+        Baked frames are rendered, possibly in parallel and without any
+        physics, by :func:`goo.render.render_baked`. See :mod:`goo.render`.
+
+        Args:
+            path: Bake directory.
+            end: Last frame of the simulation.
+            start: First frame to simulate.
+            physics_only: Whether to simulate in the reduced scene of
+                :func:`physics_only`.
+        """
+        bake(self, path, end=end, start=start, physics_only=physics_only)
+
+    def close_handlers(self):
+        """Release resources held by handlers, e.g. flush exported data to disk
+        and shut down pools of workers, and report profiling results if
+        profiling is enabled."""
+        for handler in self.handlers:
+            handler.close()
+        shutdown_executors()
+        if self.profiler is not None:
+            self.profiler.close()
+
+    def invalidate_geometry(self):
+        """Discard all cached evaluated geometry of the cells of the simulation."""
+        for cell in self.get_cells_func()():
+            cell.invalidate_cache()
+        self.geometry.invalidate()
+
+    @contextmanager
+    def physics_only(self):
+        """Context in which the scene is reduced to what physics depends on.
+
+        Objects that are neither cells, forces acting on cells, nor colliders
+        are hidden from the viewport, and modifiers following the cloth
+        modifier of cells that are not physics modifiers are disabled in the
+        viewport, such that they are not evaluated on frame changes. Both are
+        restored on exit, e.g. before rendering.
+
+        Modifiers preceding the cloth modifier (e.g. the subdivision of
+        :class:`SubsurfConstructor`) shape the simulated mesh, and are kept.
+        """
+        cells = self.get_cells_func()()
+        keep = set()
+        for cell in cells:
+            keep.add(cell.obj)
+            keep.update(cell._effectors.all_objects)
+        hidden = [
+            obj
+            for obj in bpy.context.scene.objects
+            if obj not in keep
+            and not obj.hide_viewport
+            and (obj.field is None or obj.field.type == "NONE")
+            and not any(mod.type in ("CLOTH", "COLLISION") for mod in obj.modifiers)
+        ]
+
+        disabled = set()
+        for cell in cells:
+            after_cloth = False
+            for mod in cell.obj.modifiers:
+                if mod.type == "CLOTH":
+                    after_cloth = True
+                elif after_cloth and mod.type != "COLLISION" and mod.show_viewport:
+                    disabled.add(mod.name)
+
+        for obj in hidden:
+            obj.hide_viewport = True
+        for cell in cells:
+            for name in disabled:
+                mod = cell.obj.modifiers.get(name)
+                if mod is not None:
+                    mod.show_viewport = False
+        try:
+            yield
+        finally:
+            for obj in hidden:
+                obj.hide_viewport = False
+            # including cells created since, e.g. daughters of divided cells,
+            # which inherit disabled modifiers
+            for cell in self.get_cells_func()():
+                for name in disabled:
+                    mod = cell.obj.modifiers.get(name)
+                    if mod is not None:
+                        mod.show_viewport = True
+                    # modifiers of cells with disabled physics are stored
+                    for mod_name, _, settings in cell.mod_settings:
+                        if mod_name == name:
+                            settings["show_viewport"] = True
+
+    def run(
+        self,
+        end=250,
+        start=1,
+        checkpoint_path=None,
+        checkpoint_freq=0,
+        physics_only=False,
+        report_freq=None,
+    ):
+        """Run the simulation.
+
+        Args:
+            end: Last frame of the simulation.
+            start: First frame to simulate, e.g. the frame following a
+                checkpoint restored with :func:`resume`.
+            checkpoint_path: Path of checkpoints saved during the simulation.
+            checkpoint_freq: Number of frames between checkpoints. Disabled if
+                set to 0.
+            physics_only: Whether to run in the reduced scene of
+                :func:`physics_only`, e.g. for headless runs.
+            report_freq: Number of frames between progress reports. Defaults
+                to every frame, or every 50 frames in physics only mode.
+        """
+        if report_freq is None:
+            report_freq = 50 if physics_only else 1
+
         print("----- SIMULATION START -----")
-        for i in range(1, end + 1):
-            print(i, end=" ")
-            bpy.context.scene.frame_set(i)
-        print("\n----- SIMULATION END -----")
+        self.invalidate_geometry()
+        t_start = t_report = time.perf_counter()
+        with self.physics_only() if physics_only else nullcontext():
+            for i in range(start, end + 1):
+                self.step(i)
+                if checkpoint_path and checkpoint_freq and i % checkpoint_freq == 0:
+                    self.checkpoint(checkpoint_path)
+                if report_freq == 1:
+                    print(i, end=" ")
+                elif (i - start + 1) % report_freq == 0 or i == end:
+                    now = time.perf_counter()
+                    fps = ((i - start) % report_freq + 1) / (now - t_report)
+                    print(f"frame {i}/{end} ({fps:.2f} fps)", flush=True)
+                    t_report = now
+        self.close_handlers()
+
+        n_frames = max(end - start + 1, 0)
+        elapsed = time.perf_counter() - t_start
+        print(
+            f"\nSimulated {n_frames} frames in {elapsed:.1f} s "
+            f"({n_frames / max(elapsed, 1e-9):.2f} fps)"
+        )
+        print("----- SIMULATION END -----")
+
+    def checkpoint(self, path: str):
+        """Save a checkpoint of the simulation at the current frame.
+
+        See :mod:`goo.checkpoint`.
+
+        Args:
+            path: Path of the checkpoint archive.
+        """
+        save_checkpoint(self, path)
+
+    def resume(self, path: str) -> int:
+        """Restore the simulation from a checkpoint.
+
+        The simulation must be set up as the original one, i.e. with the same
+        cell types and handlers added in the same order. The simulation can
+        then be continued with ``run(end, start=frame + 1)``.
+
+        Args:
+            path: Path of the checkpoint archive.
+
+        Returns:
+            The frame at which the checkpoint was saved.
+        """
+        return load_checkpoint(self, path)
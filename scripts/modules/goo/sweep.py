@@ -0,0 +1,347 @@
+"""Headless parameter sweeps over Goo simulations.
+
+A sweep runs a scenario once per combination of parameters of a grid, each in
+its own background process, and collects the outputs of all runs into a
+single results directory::
+
+    results/
+        manifest.json
+        run_00000/
+            params.json
+            log.txt
+            ...  (outputs written by the scenario, e.g. by DataExporter)
+
+A scenario is a factory function, given as ``"module:function"`` or
+``"path/to/file.py:function"``, that builds a simulation and returns its
+:class:`Simulator`. It is called in a fresh scene as
+``factory(seed=seed, output_dir=output_dir, **params)``, and must pass `seed`
+to :func:`Simulator.setup_world` and write its outputs (e.g. the path of a
+:class:`DataExporter`) under `output_dir`.
+
+Sweeps can be launched from Python with :func:`run_sweep`, or from the command
+line::
+
+    python -m goo.sweep run my_scenarios:growth --grid grid.json --out results
+"""
+
+import argparse
+import importlib
+import importlib.util
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Union
+
+import numpy as np
+
+
+def load_scenario(scenario: str) -> Callable:
+    """Returns the factory function of a scenario.
+
+    Args:
+        scenario: Scenario given as ``"module:function"`` or
+            ``"path/to/file.py:function"``.
+
+    Raises:
+        ValueError: If the scenario is not of either form.
+    """
+    module_name, sep, func_name = scenario.rpartition(":")
+    if not sep or not module_name or not func_name:
+        raise ValueError(
+            f"Scenario must be given as 'module:function', got '{scenario}'."
+        )
+    if module_name.endswith(".py"):
+        name = os.path.splitext(os.path.basename(module_name))[0]
+        spec = importlib.util.spec_from_file_location(name, module_name)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, func_name)
+
+
+def expand_grid(grid: Union[dict[str, list], list[dict]]) -> list[dict]:
+    """Expand a parameter grid into a list of parameter combinations.
+
+    Args:
+        grid: Either a dictionary mapping parameter names to lists of values,
+            whose Cartesian product is taken, or an explicit list of
+            parameter dictionaries.
+
+    Returns:
+        A list of parameter dictionaries.
+    """
+    if isinstance(grid, list):
+        return [dict(params) for params in grid]
+    names = list(grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(grid[name] for name in names))
+    ]
+
+
+def run_seeds(seed: int, n: int) -> list[int]:
+    """Returns n independent seeds of runs, derived from a base seed.
+
+    Seeds are limited to 31 bits, as they are stored in the scene as Blender
+    integer properties, which are signed 32-bit integers.
+    """
+    children = np.random.SeedSequence(seed).spawn(n)
+    return [int(child.generate_state(1)[0] >> 1) for child in children]
+
+
+def _default_executable() -> str:
+    """Returns the Blender binary running this process, if any, or else the
+    current Python interpreter.
+
+    Inside Blender, `sys.executable` is the bundled Python interpreter, which
+    cannot import `bpy`.
+    """
+    try:
+        import bpy
+    except ImportError:
+        return sys.executable
+    return bpy.app.binary_path or sys.executable
+
+
+def _worker_command(executable: str, scenario: str, run_dir: str) -> list[str]:
+    """Returns the command launching a worker process of a run.
+
+    Blender executables run the worker in background mode; any other
+    executable is taken to be a Python interpreter with `bpy` installed. In
+    both cases, Goo and the current directory are made importable.
+    """
+    goo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    expr = (
+        f"import sys; sys.path[:0] = {[goo_path, os.getcwd()]!r}; "
+        "from goo.sweep import main; main()"
+    )
+    args = ["worker", scenario, run_dir]
+    if os.path.basename(executable).lower().startswith("blender"):
+        return [
+            executable,
+            "--background",
+            "--factory-startup",
+            "--python-expr",
+            expr,
+            "--",
+        ] + args
+    return [executable, "-c", expr] + args
+
+
+def run_worker(scenario: str, run_dir: str):
+    """Run a single simulation of a sweep, in the current process.
+
+    Reads the parameters, seed and number of frames of the run from
+    ``params.json`` in `run_dir`, builds the simulation in a fresh scene and
+    runs it.
+
+    Args:
+        scenario: Scenario of the sweep, see :func:`load_scenario`.
+        run_dir: Directory of the run.
+    """
+    from goo.reloader import reset_scene
+
+    with open(os.path.join(run_dir, "params.json")) as f:
+        spec = json.load(f)
+
+    reset_scene()
+    factory = load_scenario(scenario)
+    sim = factory(seed=spec["seed"], output_dir=run_dir, **spec["params"])
+    sim.run(end=spec["end"])
+
+
+class Sweep:
+    """A parameter sweep over a scenario.
+
+    Runs are launched as background processes, at most `max_workers` at a
+    time. The manifest of the sweep is rewritten every time a run finishes,
+    such that partial results of interrupted sweeps are recorded.
+
+    Args:
+        scenario: Scenario of the sweep, see :func:`load_scenario`.
+        grid: Parameter grid, see :func:`expand_grid`.
+        out: Results directory.
+        end: Number of frames of each run.
+        seed: Base seed, from which seeds of runs are derived.
+        repeats: Number of runs per parameter combination, with different
+            seeds.
+        max_workers: Maximum number of concurrent runs. Defaults to, and is
+            capped at, the number of available cores.
+        executable: Blender executable, or Python interpreter with `bpy`
+            installed, used to launch runs. Defaults to the Blender binary
+            running this process, or else the current interpreter.
+        timeout: Maximum duration of each run in seconds, if set.
+
+    Attributes:
+        runs (list[dict]): Records of each run, as written to the manifest.
+    """
+
+    def __init__(
+        self,
+        scenario: str,
+        grid: Union[dict[str, list], list[dict]],
+        out: str,
+        end: int = 250,
+        seed: int = 1,
+        repeats: int = 1,
+        max_workers: int = None,
+        executable: str = None,
+        timeout: float = None,
+    ):
+        self.scenario = scenario
+        self.grid = grid
+        self.out = os.path.abspath(out)
+        self.end = end
+        self.seed = seed
+        self.repeats = repeats
+        cores = os.cpu_count() or 1
+        self.max_workers = min(max_workers or cores, cores)
+        self.executable = executable or _default_executable()
+        self.timeout = timeout
+
+        combinations = expand_grid(grid)
+        seeds = run_seeds(seed, len(combinations) * repeats)
+        self.runs = [
+            {
+                "id": i,
+                "params": params,
+                "seed": seeds[i],
+                "dir": f"run_{i:05d}",
+                "status": "pending",
+            }
+            for i, params in enumerate(
+                params for params in combinations for _ in range(repeats)
+            )
+        ]
+        self._lock = threading.Lock()
+
+    def _write_manifest(self):
+        manifest = {
+            "scenario": self.scenario,
+            "grid": self.grid,
+            "end": self.end,
+            "seed": self.seed,
+            "repeats": self.repeats,
+            "runs": self.runs,
+        }
+        tmp_path = os.path.join(self.out, "manifest.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.out, "manifest.json"))
+
+    def _run(self, run: dict):
+        run_dir = os.path.join(self.out, run["dir"])
+        os.makedirs(run_dir, exist_ok=True)
+        with open(os.path.join(run_dir, "params.json"), "w") as f:
+            spec = {"params": run["params"], "seed": run["seed"], "end": self.end}
+            json.dump(spec, f)
+
+        cmd = _worker_command(self.executable, self.scenario, run_dir)
+        start = time.perf_counter()
+        with open(os.path.join(run_dir, "log.txt"), "w") as log:
+            try:
+                proc = subprocess.run(
+                    cmd, stdout=log, stderr=subprocess.STDOUT, timeout=self.timeout
+                )
+                status = "done" if proc.returncode == 0 else "failed"
+                returncode = proc.returncode
+            except subprocess.TimeoutExpired:
+                status, returncode = "timeout", None
+
+        outputs = sorted(
+            name
+            for name in os.listdir(run_dir)
+            if name not in ("params.json", "log.txt")
+        )
+        with self._lock:
+            run.update(
+                status=status,
+                returncode=returncode,
+                duration=time.perf_counter() - start,
+                outputs=outputs,
+            )
+            self._write_manifest()
+        print(f"Run {run['id']} {status}: {run['params']}")
+
+    def run(self) -> list[dict]:
+        """Run the sweep, and return the records of each run."""
+        os.makedirs(self.out, exist_ok=True)
+        self._write_manifest()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(self._run, self.runs))
+        return self.runs
+
+
+def run_sweep(
+    scenario: str, grid: Union[dict[str, list], list[dict]], out: str, **kwargs
+) -> list[dict]:
+    """Run a parameter sweep over a scenario.
+
+    See :class:`Sweep` for arguments.
+
+    Returns:
+        The records of each run, as written to the manifest.
+    """
+    return Sweep(scenario, grid, out, **kwargs).run()
+
+
+def main(argv: list[str] = None):
+    """Command line interface of sweeps."""
+    if argv is None:
+        # arguments of Blender scripts follow "--"
+        argv = sys.argv[1:]
+        if "--" in sys.argv:
+            argv = sys.argv[sys.argv.index("--") + 1:]
+
+    parser = argparse.ArgumentParser(
+        prog="goo.sweep", description="Headless parameter sweeps over Goo simulations."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a parameter sweep.")
+    run_parser.add_argument("scenario", help="Scenario, as 'module:function'.")
+    run_parser.add_argument(
+        "--grid", required=True, help="JSON file of the parameter grid."
+    )
+    run_parser.add_argument("--out", required=True, help="Results directory.")
+    run_parser.add_argument("--end", type=int, default=250, help="Frames per run.")
+    run_parser.add_argument("--seed", type=int, default=1, help="Base seed.")
+    run_parser.add_argument("--repeats", type=int, default=1)
+    run_parser.add_argument("--workers", type=int, default=None)
+    run_parser.add_argument(
+        "--executable", default=None, help="Blender or Python executable."
+    )
+    run_parser.add_argument("--timeout", type=float, default=None)
+
+    worker_parser = subparsers.add_parser("worker", help="Run a single run of a sweep.")
+    worker_parser.add_argument("scenario")
+    worker_parser.add_argument("run_dir")
+
+    args = parser.parse_args(argv)
+    match args.command:
+        case "run":
+            with open(args.grid) as f:
+                grid = json.load(f)
+            run_sweep(
+                args.scenario,
+                grid,
+                args.out,
+                end=args.end,
+                seed=args.seed,
+                repeats=args.repeats,
+                max_workers=args.workers,
+                executable=args.executable,
+                timeout=args.timeout,
+            )
+        case "worker":
+            run_worker(args.scenario, args.run_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 from functools import reduce
+import zlib
 
+import numpy as np
 import bpy
 import bmesh
 from bpy.types import Modifier
@@ -64,6 +66,31 @@ class Axis:
         return (end - start).length
 
 
+# ----- RANDOM NUMBER GENERATION -----
+def stream_key(name: str) -> int:
+    """Returns a stable integer key of a name, to identify a random stream."""
+    return zlib.crc32(name.encode())
+
+
+def make_rng(*keys, seed: int = None) -> np.random.Generator:
+    """Returns a random number generator of an independent stream.
+
+    Streams are derived from the seed of the simulation with
+    `numpy.random.SeedSequence`, and identified by a sequence of keys (e.g.
+    the name of a handler and of a cell). The same keys always give the same
+    stream for the same seed, regardless of any other streams in use.
+
+    Args:
+        keys: Names or integers identifying the stream.
+        seed: Seed from which streams are derived. Defaults to the seed of the
+            scene, set by :func:`Simulator.setup_world`.
+    """
+    if seed is None:
+        seed = bpy.context.scene.get("seed", 0)
+    spawn_key = tuple(stream_key(k) if isinstance(k, str) else int(k) for k in keys)
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=spawn_key))
+
+
 # ----- BLENDER FUNCTIONS -----
 def create_mesh(
     name,
@@ -112,7 +139,34 @@ def create_mesh(
     return obj
 
 
-def create_material(name, color):
+def set_material_color(mat: bpy.types.Material, color: tuple[float, float, float]):
+    """Set the color of a material, preserving alpha values.
+
+    Sets the diffuse (viewport) color of the material and, if the material
+    uses nodes, the 'Base Color' input of any nodes that have it.
+    """
+    r, g, b = color[:3]
+    _, _, _, a = mat.diffuse_color
+    mat.diffuse_color = (r, g, b, a)
+
+    if mat.use_nodes:
+        for node in mat.node_tree.nodes:
+            if "Base Color" in node.inputs:
+                _, _, _, a = node.inputs["Base Color"].default_value
+                node.inputs["Base Color"].default_value = r, g, b, a
+
+
+def create_material(name, color, object_color=False):
+    """Create a cell material.
+
+    Args:
+        name: Name of the material.
+        color: Color (r, g, b) of the material.
+        object_color: Whether the base color is instead read from the color of
+            each object using the material (`Object.color`), through an
+            Object Info node, such that the material can be shared by objects
+            of different colors.
+    """
     mat = bpy.data.materials.new(name=name)
     r, g, b = color
     mat.diffuse_color = (r, g, b, 0.8)  # viewport color
@@ -136,6 +190,13 @@ def create_material(name, color):
     node_main.inputs["Anisotropic Rotation"].default_value = 0.048
     node_main.inputs["Alpha"].default_value = 0.414
 
+    if object_color:
+        node_info = nodes.new(type="ShaderNodeObjectInfo")
+        node_info.location = -400, 100
+        links = mat.node_tree.links
+        links.new(node_info.outputs["Color"], node_main.inputs["Base Color"])
+        mat["object_color"] = True
+
     # create noise texture source
     node_noise = nodes.new(type="ShaderNodeTexNoise")
     node_noise.inputs["Scale"].default_value = 0.600